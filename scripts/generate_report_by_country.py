@@ -1,12 +1,13 @@
 import os
-import json
-import csv
-import sys
 import argparse
 from pathlib import Path
 from datetime import datetime
 import urllib.parse
 
+from gmc_io import is_csv, csv_stem
+from gmc_schema import load_rows, rank_key, price_range, cell
+from gmc_taxonomy import Taxonomy
+
 # 国家代码映射（从lib/country-google-shopping.ts复制）
 country_google_shopping_map = {
     'AF': {'gl': 'af', 'hl': 'fa'},  # Afghanistan
@@ -139,35 +140,9 @@ def get_shopping_url(product_title, country_code):
     encoded_title = urllib.parse.quote(product_title)
     return f"https://www.google.com/search?tbm=shop&q={encoded_title}&gl={gl}&hl={hl}"
 
-def find_category_name(nodes, code):
-    """递归查找 catalog_name"""
-    for n in nodes:
-        if n['code'] == code:
-            return n['catalog_name']
-        if n.get('children'):
-            found = find_category_name(n['children'], code)
-            if found:
-                return found
-    return ''
-
-def parse_num(v):
-    """解析数字"""
-    if not v:
-        return 0
-    return float(str(v).replace(',', '').replace('$', '').replace('£', '').replace('€', '').replace('¥', '').replace('₹', '').replace('₽', '').replace('₩', '').replace('₪', '').replace('₦', '').replace('₨', '').replace('₴', '').replace('₸', '').replace('₺', '').replace('₼', '').replace('₾', '').replace('₿', '').replace(' ', ''))
-
-def price_range(row):
-    """生成价格区间字符串"""
-    if row.get('price_min') and row.get('price_max') and row['price_min'] != row['price_max']:
-        return f"{row['price_min']} - {row['price_max']} {row.get('price_currency', '')}"
-    elif row.get('price_min'):
-        return f"{row['price_min']} {row.get('price_currency', '')}"
-    else:
-        return ''
-
-def get_category_name(categories, code):
-    """获取类目名称"""
-    return find_category_name(categories, code) or code
+def get_category_name(taxonomy, code):
+    """获取类目名称，找不到时返回 code"""
+    return taxonomy.name.get(code) or code
 
 def main():
     # 解析命令行参数
@@ -187,8 +162,7 @@ def main():
         print("错误: categories.json 文件不存在！")
         return
     
-    with open(categories_path, 'r', encoding='utf-8') as f:
-        categories = json.load(f)
+    taxonomy = Taxonomy.load(categories_path)
     
     # 查找国家目录
     output_root = Path(__file__).parent.parent / 'gmc_data' / 'output'
@@ -211,7 +185,7 @@ def main():
         return
     
     # 查找所有CSV文件
-    csv_files = [f for f in report_dir.iterdir() if f.suffix == '.csv']
+    csv_files = [f for f in report_dir.iterdir() if f.is_file() and is_csv(f)]
     print(f"找到CSV文件: {[f.name for f in csv_files]}")
     
     if not csv_files:
@@ -227,12 +201,7 @@ def main():
         csv_path = report_dir / csv_file.name
         
         # 读取CSV数据
-        rows = []
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row.get('product_title'):
-                    rows.append(row)
+        rows = load_rows(csv_path)
         
         print(f"  读取到 {len(rows)} 行数据")
         
@@ -241,11 +210,9 @@ def main():
             continue
         
         # Top 10 产品（按rank排序，取前十，product_title唯一）
-        def rank_num(v):
-            return parse_num(v)
         
         # 按rank升序排序
-        sorted_rows = sorted(rows, key=lambda x: rank_num(x.get('rank', 0)))
+        sorted_rows = sorted(rows, key=rank_key)
         seen_titles = set()
         top_products = []
         for r in sorted_rows:
@@ -257,7 +224,7 @@ def main():
         
         # Top Performing Products - no brand
         top_no_brand_products = [r for r in rows if not r.get('brand') or str(r.get('brand', '')).strip() == '' or r.get('brand') == 'no brand']
-        top_no_brand_products = sorted(top_no_brand_products, key=lambda x: rank_num(x.get('rank', 0)))[:10]
+        top_no_brand_products = sorted(top_no_brand_products, key=rank_key)[:10]
         
         # 品牌分布
         brand_count = {}
@@ -295,10 +262,9 @@ def main():
         # Fastest Growing Products
         growth_rows = []
         for r in rows:
-            if (r.get('rank') and r.get('previous_rank') and 
-                not str(r['rank']).strip() == '' and not str(r['previous_rank']).strip() == ''):
+            if r.get('rank') is not None and r.get('previous_rank') is not None:
                 try:
-                    rank_change = int(r['previous_rank']) - int(r['rank'])
+                    rank_change = r['previous_rank'] - r['rank']
                     demand_change = ''
                     if (r.get('previous_relative_demand_bucket') and r.get('relative_demand_bucket') and 
                         r['previous_relative_demand_bucket'] != r['relative_demand_bucket']):
@@ -319,8 +285,7 @@ def main():
         # 新品
         new_entries = []
         for r in rows:
-            if ((not r.get('previous_rank') or str(r.get('previous_rank', '')).strip() == '') and 
-                r.get('rank') and str(r.get('rank', '')).strip() != ''):
+            if r.get('previous_rank') is None and r.get('rank') is not None:
                 new_entries.append({
                     **r,
                     'rank_change': 'New entry',
@@ -337,9 +302,9 @@ def main():
         current_date = datetime.now().strftime('%Y-%m-%d')
         
         # 从文件名提取类目ID
-        filename_parts = csv_file.stem.split('_')
+        filename_parts = csv_stem(csv_file).split('_')
         category_id = filename_parts[-1] if len(filename_parts) > 1 else ''
-        category_name = get_category_name(categories, category_id) if category_id else ''
+        category_name = get_category_name(taxonomy, category_id) if category_id else ''
         
         sub_header = f"Week of {current_date} | {category_name} | {args.country}"
         
@@ -365,10 +330,10 @@ def main():
             <tbody>
               {''.join([f'''
                 <tr>
-                  <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{p.get('rank', '')}</td>
+                  <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{cell(p.get('rank'))}</td>
                   <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;"><a href="{get_shopping_url(p.get('product_title', ''), args.country)}" target="_blank" rel="noopener noreferrer" style="color:#2196f3;text-decoration:none;">{p.get('product_title', '')}</a></td>
                   <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{p.get('brand', '-')}</td>
-                  <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{get_category_name(categories, p.get('ranking_category', ''))}</td>
+                  <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{get_category_name(taxonomy, p.get('ranking_category', ''))}</td>
                   <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{price_range(p)}</td>
                   <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{p.get('relative_demand_bucket', '')}</td>
                 </tr>
@@ -390,10 +355,10 @@ def main():
             <tbody>
               {''.join([f'''
                 <tr>
-                  <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{p.get('rank', '')}</td>
+                  <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{cell(p.get('rank'))}</td>
                   <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;"><a href="{get_shopping_url(p.get('product_title', ''), args.country)}" target="_blank" rel="noopener noreferrer" style="color:#2196f3;text-decoration:none;">{p.get('product_title', '')}</a></td>
                   <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{p.get('brand', '-')}</td>
-                  <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{get_category_name(categories, p.get('ranking_category', ''))}</td>
+                  <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{get_category_name(taxonomy, p.get('ranking_category', ''))}</td>
                   <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{price_range(p)}</td>
                   <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{p.get('relative_demand_bucket', '')}</td>
                 </tr>
@@ -416,11 +381,11 @@ def main():
             <tbody>
               {''.join([f'''
                 <tr>
-                  <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{p.get('rank', '')}</td>
-                  <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{p.get('previous_rank', '')}</td>
+                  <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{cell(p.get('rank'))}</td>
+                  <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{cell(p.get('previous_rank'))}</td>
                   <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;"><a href="{get_shopping_url(p.get('product_title', ''), args.country)}" target="_blank" rel="noopener noreferrer" style="color:#2196f3;text-decoration:none;">{p.get('product_title', '')}</a></td>
                   <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{p.get('brand', '-')}</td>
-                  <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{get_category_name(categories, p.get('ranking_category', ''))}</td>
+                  <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;">{get_category_name(taxonomy, p.get('ranking_category', ''))}</td>
                   <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;color:{'#1dbf73' if isinstance(p.get('rank_change'), int) and p.get('rank_change', 0) > 0 else '#888'};font-weight:600;">{p.get('rank_change', '')}</td>
                   <td style="padding:8px 12px;border-bottom:1px solid #e0e3e8;color:{'#1dbf73' if p.get('demand_change', '').find('→') != -1 else '#888'};font-weight:600;">{p.get('demand_change', '')}</td>
                 </tr>
@@ -435,7 +400,7 @@ def main():
       '''
         
         # 保存 HTML
-        html_file_path = csv_path.with_suffix('.analyzed.html')
+        html_file_path = report_dir / f'{csv_stem(csv_path)}.analyzed.html'
         with open(html_file_path, 'w', encoding='utf-8') as f:
             f.write(html)
         
@@ -64,9 +64,6 @@ Google Merchant Center (GMC) 数据分析报告生成器 - Gemini AI版本
 """
 
 import os
-import json
-import csv
-import sys
 import argparse
 from pathlib import Path
 from datetime import datetime
@@ -74,6 +71,10 @@ import urllib.parse
 import re
 import requests
 
+from gmc_io import is_csv, csv_stem
+from gmc_schema import load_rows, rank_key, price_range, cell
+from gmc_taxonomy import Taxonomy
+
 # 国家代码映射（从lib/country-google-shopping.ts复制）
 country_google_shopping_map = {
     'AF': {'gl': 'af', 'hl': 'fa'},  # Afghanistan
@@ -277,41 +278,9 @@ Please respond in English, around 100 words."""
             print(f"  错误详情: {e.response.text}")
         return None
 
-def find_category_name(nodes, code):
-    """递归查找 catalog_name"""
-    for n in nodes:
-        if n['code'] == code:
-            return n['catalog_name']
-        if n.get('children'):
-            found = find_category_name(n['children'], code)
-            if found:
-                return found
-    return ''
-
-def parse_num(v):
-    """解析数字，移除货币符号和逗号"""
-    if not v:
-        return 0
-    try:
-        # 移除非数字和非小数点的所有字符
-        cleaned_v = re.sub(r'[^\d.]', '', str(v))
-        return float(cleaned_v)
-    except (ValueError, TypeError):
-        return 0
-
-
-def price_range(row):
-    """生成价格区间字符串"""
-    if row.get('price_min') and row.get('price_max') and row['price_min'] != row['price_max']:
-        return f"{row['price_min']} - {row['price_max']} {row.get('price_currency', '')}"
-    elif row.get('price_min'):
-        return f"{row['price_min']} {row.get('price_currency', '')}"
-    else:
-        return ''
-
-def get_category_name(categories, code):
-    """获取类目名称"""
-    return find_category_name(categories, code) or code
+def get_category_name(taxonomy, code):
+    """获取类目名称，找不到时返回 code"""
+    return taxonomy.name.get(code) or code
 
 def main():
     # 解析命令行参数
@@ -331,8 +300,7 @@ def main():
         print(f"错误: categories.json 文件在 {categories_path} 未找到！")
         return
     
-    with open(categories_path, 'r', encoding='utf-8') as f:
-        categories = json.load(f)
+    taxonomy = Taxonomy.load(categories_path)
     
     # 查找国家目录
     output_root = Path(__file__).parent.parent / 'gmc_data' / 'output'
@@ -349,19 +317,19 @@ def main():
         return
     
     # 查找所有CSV文件
-    csv_files = list(report_dir.glob('*.csv'))
+    csv_files = [f for f in report_dir.iterdir() if f.is_file() and is_csv(f)]
     
     # 如果指定了categoryid，只处理匹配的文件
     if args.categoryid:
         # 文件名格式为 {country}_{categoryid}.csv
         # 注意：脚本描述中的文件名格式和示例不一致，这里采用更灵活的匹配方式
         # 匹配以 `_{args.categoryid}.csv` 结尾的文件
-        filtered_csv_files = [f for f in csv_files if f.name.endswith(f'_{args.categoryid}.csv')]
+        filtered_csv_files = [f for f in csv_files if csv_stem(f).endswith(f'_{args.categoryid}')]
         
         if not filtered_csv_files:
              # 如果上述找不到，尝试完全匹配 {country}_{categoryid}.csv
              exact_match_filename = f"{args.country}_{args.categoryid}.csv"
-             filtered_csv_files = [f for f in csv_files if f.name == exact_match_filename]
+             filtered_csv_files = [f for f in csv_files if csv_stem(f) == csv_stem(exact_match_filename)]
 
         csv_files = filtered_csv_files
     
@@ -383,13 +351,8 @@ def main():
         csv_path = report_dir / csv_file.name
         
         # 读取CSV数据
-        rows = []
         try:
-            with open(csv_path, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if row.get('product_title'):
-                        rows.append(row)
+            rows = load_rows(csv_path)
         except Exception as e:
             print(f"  读取文件失败: {e}")
             continue
@@ -401,10 +364,8 @@ def main():
             continue
         
         # Top 10 产品（按rank排序，取前十，product_title唯一）
-        def rank_num(v):
-            return int(parse_num(v.get('rank', 0))) if v.get('rank') else sys.maxsize
 
-        sorted_rows = sorted(rows, key=rank_num)
+        sorted_rows = sorted(rows, key=rank_key)
         seen_titles = set()
         top_products = []
         for r in sorted_rows:
@@ -416,7 +377,7 @@ def main():
         
         # Top Performing Products - no brand
         top_no_brand_products = [r for r in rows if not r.get('brand') or str(r.get('brand', '')).strip() == '' or r.get('brand') == 'no brand']
-        top_no_brand_products = sorted(top_no_brand_products, key=rank_num)[:10]
+        top_no_brand_products = sorted(top_no_brand_products, key=rank_key)[:10]
         
         # 品牌分布
         brand_count = {}
@@ -458,10 +419,9 @@ def main():
         # Fastest Growing Products
         growth_rows = []
         for r in rows:
-            if (r.get('rank') and r.get('previous_rank') and 
-                str(r['rank']).strip() and str(r['previous_rank']).strip()):
+            if r.get('rank') is not None and r.get('previous_rank') is not None:
                 try:
-                    rank_change = int(r['previous_rank']) - int(r['rank'])
+                    rank_change = r['previous_rank'] - r['rank']
                     demand_change = ''
                     if (r.get('previous_relative_demand_bucket') and r.get('relative_demand_bucket') and 
                         r['previous_relative_demand_bucket'] != r['relative_demand_bucket']):
@@ -482,8 +442,7 @@ def main():
         # 新品
         new_entries = []
         for r in rows:
-            if ((not r.get('previous_rank') or not str(r.get('previous_rank', '')).strip()) and 
-                (r.get('rank') and str(r.get('rank', '')).strip())):
+            if r.get('previous_rank') is None and r.get('rank') is not None:
                 new_entries.append({
                     **r,
                     'rank_change': 'New entry',
@@ -500,8 +459,8 @@ def main():
         current_date = datetime.now().strftime('%Y-%m-%d')
         
         # 从文件名提取类目ID
-        category_id_from_file = csv_file.stem.split('_')[-1]
-        category_name = get_category_name(categories, category_id_from_file)
+        category_id_from_file = csv_stem(csv_file).split('_')[-1]
+        category_name = get_category_name(taxonomy, category_id_from_file)
         
         sub_header = f"Week of {current_date} | {category_name} | {args.country}"
         
@@ -509,10 +468,10 @@ def main():
         # 生成各表格 HTML 片段
         top_products_html = ''.join([
             f"<tr>"
-            f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('rank', '')}</td>"
+            f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{cell(p.get('rank'))}</td>"
             f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'><a href=\"{get_shopping_url(p.get('product_title', ''), args.country)}\" target=\"_blank\" rel=\"noopener noreferrer\" style=\"color:#2196f3;text-decoration:none;\">{p.get('product_title', '')}</a></td>"
             f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('brand', '-')}</td>"
-            f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{get_category_name(categories, p.get('ranking_category', ''))}</td>"
+            f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{get_category_name(taxonomy, p.get('ranking_category', ''))}</td>"
             f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{price_range(p)}</td>"
             f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('relative_demand_bucket', '')}</td>"
             f"</tr>"
@@ -520,10 +479,10 @@ def main():
         ])
         top_no_brand_products_html = ''.join([
             f"<tr>"
-            f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('rank', '')}</td>"
+            f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{cell(p.get('rank'))}</td>"
             f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'><a href=\"{get_shopping_url(p.get('product_title', ''), args.country)}\" target=\"_blank\" rel=\"noopener noreferrer\" style=\"color:#2196f3;text-decoration:none;\">{p.get('product_title', '')}</a></td>"
             f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('brand', '-')}</td>"
-            f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{get_category_name(categories, p.get('ranking_category', ''))}</td>"
+            f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{get_category_name(taxonomy, p.get('ranking_category', ''))}</td>"
             f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{price_range(p)}</td>"
             f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('relative_demand_bucket', '')}</td>"
             f"</tr>"
@@ -531,11 +490,11 @@ def main():
         ])
         fastest_growing_html = ''.join([
             f"<tr>"
-            f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('rank', '')}</td>"
-            f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('previous_rank', '')}</td>"
+            f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{cell(p.get('rank'))}</td>"
+            f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{cell(p.get('previous_rank'))}</td>"
             f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'><a href=\"{get_shopping_url(p.get('product_title', ''), args.country)}\" target=\"_blank\" rel=\"noopener noreferrer\" style=\"color:#2196f3;text-decoration:none;\">{p.get('product_title', '')}</a></td>"
             f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('brand', '-')}</td>"
-            f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{get_category_name(categories, p.get('ranking_category', ''))}</td>"
+            f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{get_category_name(taxonomy, p.get('ranking_category', ''))}</td>"
             f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;color:{'#1dbf73' if isinstance(p.get('rank_change'), int) and p.get('rank_change', 0) > 0 else '#888'};font-weight:600;'>{p.get('rank_change', '')}</td>"
             f"<td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;color:{'#1dbf73' if '→' in str(p.get('demand_change', '')) else '#888'};font-weight:600;'>{p.get('demand_change', '')}</td>"
             f"</tr>"
@@ -626,7 +585,7 @@ def main():
         )
         
         # 保存 HTML
-        html_file_path = csv_path.with_suffix('.analyzed.html')
+        html_file_path = report_dir / f'{csv_stem(csv_path)}.analyzed.html'
         with open(html_file_path, 'w', encoding='utf-8') as f:
             f.write(html)
         
@@ -637,7 +596,7 @@ def main():
             print(f"  {summary}")
             
             # 保存总结到文件
-            summary_file_path = csv_path.with_suffix('.summary.txt')
+            summary_file_path = report_dir / f'{csv_stem(csv_path)}.summary.txt'
             with open(summary_file_path, 'w', encoding='utf-8') as f:
                 f.write(f"数据来源: {args.country} - {category_name}\n")
                 f.write(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
@@ -56,9 +56,6 @@ Google Merchant Center (GMC) 关键词数据分析报告生成器 - Gemini AI版
 """
 
 import os
-import json
-import csv
-import sys
 import argparse
 from pathlib import Path
 from datetime import datetime
@@ -66,6 +63,9 @@ import urllib.parse
 import re
 import requests
 
+from gmc_io import csv_name, COMPRESSION_SUFFIXES
+from gmc_schema import load_rows, rank_key, price_range, cell
+
 def get_shopping_url(product_title, country_code):
     if not product_title:
         return '#'
@@ -124,21 +124,6 @@ def call_gemini_api(data_text, country, keyword):
         print(f"  Gemini API调用失败: {e}")
         return None
 
-def parse_num(v):
-    try:
-        return int(v)
-    except Exception:
-        return 0
-
-def price_range(row):
-    """生成价格区间字符串，与 category 版一致"""
-    if row.get('price_min') and row.get('price_max') and row['price_min'] != row['price_max']:
-        return f"{row['price_min']} - {row['price_max']} {row.get('price_currency', '')}"
-    elif row.get('price_min'):
-        return f"{row['price_min']} {row.get('price_currency', '')}"
-    else:
-        return ''
-
 def main():
     parser = argparse.ArgumentParser(description='生成国家keyword CSV的HTML报表')
     parser.add_argument('country', type=str, help='国家代码，如 US, AE 等')
@@ -159,28 +144,23 @@ def main():
     if not report_dir.exists():
         print(f"错误: Report目录 {report_dir} 不存在！")
         return
-    # 文件名如 US_{keyword}.csv
-    keyword_csv_name = f"{args.country}_{args.keyword}.csv"
-    keyword_csv_path = report_dir / keyword_csv_name
+    # 文件名如 US_{keyword}.csv（也可能是 .csv.gz / .csv.zst）
+    keyword_csv_stem = f"{args.country}_{args.keyword}"
+    candidates = [report_dir / csv_name(keyword_csv_stem, c) for c in [None, *COMPRESSION_SUFFIXES.values()]]
+    keyword_csv_path = next((p for p in candidates if p.exists()), candidates[0])
     if not keyword_csv_path.exists():
         print(f"错误: 未找到 {keyword_csv_path}")
         return
 
     # 读取CSV数据
-    rows = []
-    with open(keyword_csv_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            rows.append(row)
+    rows = load_rows(keyword_csv_path, require_title=False)
     print(f"  读取到 {len(rows)} 行数据")
     if not rows:
         print(f"  文件 {keyword_csv_path} 无数据，跳过")
         return
 
     # Top 10 产品
-    def rank_num(v):
-        return parse_num(v)
-    sorted_rows = sorted(rows, key=lambda x: rank_num(x.get('rank', 0)))
+    sorted_rows = sorted(rows, key=rank_key)
     seen_titles = set()
     top_products = []
     for r in sorted_rows:
@@ -192,7 +172,7 @@ def main():
 
     # Top Performing Products - no brand
     top_no_brand_products = [r for r in rows if not r.get('brand') or str(r.get('brand', '')).strip() == '' or r.get('brand') == 'no brand']
-    top_no_brand_products = sorted(top_no_brand_products, key=lambda x: rank_num(x.get('rank', 0)))[:10]
+    top_no_brand_products = sorted(top_no_brand_products, key=rank_key)[:10]
 
     # 品牌分布
     brand_count = {}
@@ -211,10 +191,9 @@ def main():
     # Fastest Growing Products
     growth_rows = []
     for r in rows:
-        if (r.get('rank') and r.get('previous_rank') and 
-            not str(r['rank']).strip() == '' and not str(r['previous_rank']).strip() == ''):
+        if r.get('rank') is not None and r.get('previous_rank') is not None:
             try:
-                rank_change = int(r['previous_rank']) - int(r['rank'])
+                rank_change = r['previous_rank'] - r['rank']
                 demand_change = ''
                 if (r.get('previous_relative_demand_bucket') and r.get('relative_demand_bucket') and 
                     r['previous_relative_demand_bucket'] != r['relative_demand_bucket']):
@@ -233,8 +212,7 @@ def main():
     # 新品
     new_entries = []
     for r in rows:
-        if ((not r.get('previous_rank') or str(r.get('previous_rank', '')).strip() == '') and 
-            r.get('rank') and str(r.get('rank', '')).strip() != ''):
+        if r.get('previous_rank') is None and r.get('rank') is not None:
             new_entries.append({
                 **r,
                 'rank_change': 'New entry',
@@ -253,9 +231,9 @@ def main():
     # 生成各部分HTML
     brand_table_rows_html = ''.join([f"<tr><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{row['brand']}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{row['share']}</td></tr>" for row in brand_table_rows])
     brand_table_html = f'<table style="width:100%;border-collapse:collapse;margin-bottom:2rem;"><thead><tr style="background:#f5f7fa;color:#222;font-size:1rem;"><th style="padding:8px 12px;border-bottom:2px solid #e0e3e8;text-align:left;">Brand</th><th style="padding:8px 12px;border-bottom:2px solid #e0e3e8;text-align:left;">Share</th></tr></thead><tbody>{brand_table_rows_html}</tbody></table>'
-    top_products_html = ''.join([f"<tr><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('rank', '')}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'><a href=\"{get_shopping_url(p.get('product_title', ''), args.country)}\" target=\"_blank\" rel=\"noopener noreferrer\" style=\"color:#2196f3;text-decoration:none;\">{p.get('product_title', '')}</a></td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('brand', '-')}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{price_range(p)}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('relative_demand_bucket', '')}</td></tr>" for p in top_products])
-    top_no_brand_products_html = ''.join([f"<tr><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('rank', '')}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'><a href=\"{get_shopping_url(p.get('product_title', ''), args.country)}\" target=\"_blank\" rel=\"noopener noreferrer\" style=\"color:#2196f3;text-decoration:none;\">{p.get('product_title', '')}</a></td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('brand', '-')}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{price_range(p)}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('relative_demand_bucket', '')}</td></tr>" for p in top_no_brand_products])
-    fastest_growing_html = ''.join([f"<tr><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('rank', '')}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('previous_rank', '')}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'><a href=\"{get_shopping_url(p.get('product_title', ''), args.country)}\" target=\"_blank\" rel=\"noopener noreferrer\" style=\"color:#2196f3;text-decoration:none;\">{p.get('product_title', '')}</a></td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('brand', '-')}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{price_range(p)}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;color:{'#1dbf73' if isinstance(p.get('rank_change'), int) and p.get('rank_change', 0) > 0 else '#888'};font-weight:600;'>{p.get('rank_change', '')}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;color:{'#1dbf73' if p.get('demand_change', '').find('→') != -1 else '#888'};font-weight:600;'>{p.get('demand_change', '')}</td></tr>" for p in fastest_growing])
+    top_products_html = ''.join([f"<tr><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{cell(p.get('rank'))}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'><a href=\"{get_shopping_url(p.get('product_title', ''), args.country)}\" target=\"_blank\" rel=\"noopener noreferrer\" style=\"color:#2196f3;text-decoration:none;\">{p.get('product_title', '')}</a></td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('brand', '-')}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{price_range(p)}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('relative_demand_bucket', '')}</td></tr>" for p in top_products])
+    top_no_brand_products_html = ''.join([f"<tr><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{cell(p.get('rank'))}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'><a href=\"{get_shopping_url(p.get('product_title', ''), args.country)}\" target=\"_blank\" rel=\"noopener noreferrer\" style=\"color:#2196f3;text-decoration:none;\">{p.get('product_title', '')}</a></td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('brand', '-')}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{price_range(p)}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('relative_demand_bucket', '')}</td></tr>" for p in top_no_brand_products])
+    fastest_growing_html = ''.join([f"<tr><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{cell(p.get('rank'))}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{cell(p.get('previous_rank'))}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'><a href=\"{get_shopping_url(p.get('product_title', ''), args.country)}\" target=\"_blank\" rel=\"noopener noreferrer\" style=\"color:#2196f3;text-decoration:none;\">{p.get('product_title', '')}</a></td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{p.get('brand', '-')}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;'>{price_range(p)}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;color:{'#1dbf73' if isinstance(p.get('rank_change'), int) and p.get('rank_change', 0) > 0 else '#888'};font-weight:600;'>{p.get('rank_change', '')}</td><td style='padding:8px 12px;border-bottom:1px solid #e0e3e8;color:{'#1dbf73' if p.get('demand_change', '').find('→') != -1 else '#888'};font-weight:600;'>{p.get('demand_change', '')}</td></tr>" for p in fastest_growing])
 
     # 准备用于AI分析的临时HTML
     temp_html = (
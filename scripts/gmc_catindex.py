@@ -0,0 +1,141 @@
+"""
+按类目排序的国家文件与类目字节区间索引
+
+sort_country_file 把国家 CSV 原地改写成按 (类目在 categories.json 中的前序位置, 排名) 排序，
+同时写一个 <国家文件>.catidx.json 旁路索引：{类目 code: [起始字节, 结束字节, 行数]}。
+前序遍历中一个类目的子树是连续的，所以整棵子树的数据在文件中也是一段连续字节，
+按类目提取时只需 seek 到起点顺序读一段，不再扫描整个国家文件。
+
+索引记录国家文件的大小和修改时间，以及排序时所用类目树的摘要（Taxonomy.digest），
+文件被重新生成或 categories.json 的结构变化后索引自动失效，读取方回退到全量扫描。
+只支持未压缩的国家文件（压缩流无法按字节偏移 seek）。排序需要 numpy（随 pandas 安装）。
+"""
+
+import os
+import csv
+import json
+import mmap
+from array import array
+from pathlib import Path
+
+from gmc_io import iter_record_spans, compression_of
+from gmc_taxonomy import Taxonomy
+
+INDEX_SUFFIX = '.catidx.json'
+# 排名为空或无法解析的行排在同类目的最后
+MISSING_RANK = 2 ** 62
+
+def index_path(csv_path):
+    csv_path = Path(csv_path)
+    return csv_path.with_name(csv_path.name + INDEX_SUFFIX)
+
+def _parse_rank(value):
+    try:
+        return int(value)
+    except ValueError:
+        return MISSING_RANK
+
+def sort_country_file(csv_path, taxonomy=None):
+    """按类目前序位置和排名排序国家文件并写出索引，返回索引路径；压缩文件不处理，返回 None
+
+    同一类目、同一排名的行保持原有顺序。
+    """
+    import numpy as np
+
+    csv_path = Path(csv_path)
+    if compression_of(csv_path):
+        return None
+    taxonomy = taxonomy or Taxonomy.load()
+    categories = {}
+    cat_ids = array('q')
+    ranks = array('q')
+    starts = array('q')
+    ends = array('q')
+    with open(csv_path, 'rb') as f:
+        header_line = f.readline()
+        header = next(csv.reader([header_line.decode('utf-8')]))
+        columns = (header.index('ranking_category'), header.index('rank'))
+        for (category, rank), record, start in iter_record_spans(f, columns, len(header_line)):
+            cat_id = categories.get(category)
+            if cat_id is None:
+                cat_id = categories[category] = len(categories)
+            cat_ids.append(cat_id)
+            ranks.append(_parse_rank(rank))
+            # 空行不属于任何记录，按各记录自己的区间取字节
+            starts.append(start)
+            ends.append(start + len(record))
+
+    # 类目 -> 排序位置：已知类目用前序位置，categories.json 中没有的类目按 code 排在最后
+    codes = [category.decode('utf-8') for category in categories]
+    unknown = sorted(code for code in codes if code not in taxonomy.index)
+    unknown_pos = {code: len(taxonomy.order) + i for i, code in enumerate(unknown)}
+    cat_pos = np.array([taxonomy.index.get(code, unknown_pos.get(code)) for code in codes], dtype=np.int64)
+    keys = cat_pos[np.frombuffer(cat_ids, dtype=np.int64)]
+    order = np.lexsort((np.frombuffer(ranks, dtype=np.int64), keys))
+
+    ranges = {}
+    tmp_path = csv_path.with_name(csv_path.name + '.sorting')
+    with open(csv_path, 'rb') as f, open(tmp_path, 'wb') as out:
+        out.write(header_line)
+        pos = len(header_line)
+        current = None
+        if len(order):
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for i in order.tolist():
+                    cat_id = cat_ids[i]
+                    if cat_id != current:
+                        if current is not None:
+                            ranges[codes[current]][1] = pos
+                        ranges[codes[cat_id]] = [pos, pos, 0]
+                        current = cat_id
+                    ranges[codes[cat_id]][2] += 1
+                    record = data[starts[i]:ends[i]]
+                    if not record.endswith(b'\n'):
+                        record += b'\n'
+                    out.write(record)
+                    pos += len(record)
+            finally:
+                data.close()
+            ranges[codes[current]][1] = pos
+    os.replace(tmp_path, csv_path)
+
+    st = os.stat(csv_path)
+    index = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'taxonomy': taxonomy.digest(),
+             'header_size': len(header_line), 'ranges': ranges}
+    path = index_path(csv_path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+def load_category_index(csv_path, taxonomy=None):
+    """读取国家文件的类目索引；索引不存在、国家文件已变化或排序时的类目树与 taxonomy 不同时返回 None"""
+    path = index_path(csv_path)
+    if compression_of(csv_path) or not path.exists():
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    st = os.stat(csv_path)
+    if (index.get('size'), index.get('mtime_ns')) != (st.st_size, st.st_mtime_ns):
+        return None
+    if index.get('taxonomy') != (taxonomy or Taxonomy.load()).digest():
+        return None
+    return index
+
+def subtree_ranges(index, taxonomy, code):
+    """类目子树（自身及全部子孙）数据所在的字节区间和行数 ([(start, end), ...], rows)
+
+    区间按文件顺序排列，首尾相接的合并成一段；正常情况下整棵子树只有一段。
+    各类目的区间分别取，即使子树在文件中不连续，也不会包含子树以外的行。
+    """
+    ranges = index['ranges']
+    spans = sorted(ranges[c] for c in taxonomy.descendants(code) if c in ranges)
+    merged = []
+    for start, end, _ in spans:
+        if merged and merged[-1][1] == start:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [tuple(span) for span in merged], sum(span[2] for span in spans)
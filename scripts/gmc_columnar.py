@@ -0,0 +1,107 @@
+"""
+国家数据的列式副本（Parquet）
+
+拆分脚本在生成 output/<country>/<country>.csv 的同时可以写一份 <country>.parquet：
+数值列是定长类型，brand、ranking_category、price_currency 以及需求档位等重复度高的列做字典编码。
+读取方用 read_country_frame 按需加载列，Parquet 存在且不比 CSV 旧时优先读它，否则回退到带类型的 read_csv。
+二/三级类目拆分用 load_category_groups 只读取一次国家数据，按类目分组后由 select_categories 取出各输出的行。
+
+依赖 pyarrow（可选）。未安装时 write_parquet 会给出提示并跳过，读取自动回退到 CSV。
+"""
+
+from pathlib import Path
+
+from gmc_io import csv_stem
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+DICTIONARY_COLUMNS = [
+    'rank_timestamp', 'ranking_country', 'ranking_category', 'brand', 'price_currency',
+    'relative_demand_bucket', 'previous_relative_demand_bucket',
+]
+INT_COLUMNS = [
+    'rank', 'previous_rank',
+    'relative_demand_min', 'relative_demand_max',
+    'previous_relative_demand_min', 'previous_relative_demand_max',
+]
+FLOAT_COLUMNS = ['price_min', 'price_max']
+
+# pd.read_csv 回退时使用的类型，类目代码保持字符串以便与 categories.json 中的 code 比较
+CSV_DTYPES = {
+    **{col: 'category' for col in DICTIONARY_COLUMNS},
+    **{col: 'Int32' for col in INT_COLUMNS},
+    **{col: 'float64' for col in FLOAT_COLUMNS},
+    'ranking_category': str,
+    'product_title': str,
+}
+
+def parquet_path(csv_path):
+    """US.csv / US.csv.gz -> US.parquet"""
+    return Path(csv_path).with_name(csv_stem(csv_path) + '.parquet')
+
+def arrow_column_types():
+    types = {col: pa.dictionary(pa.int32(), pa.string()) for col in DICTIONARY_COLUMNS}
+    types.update({col: pa.int32() for col in INT_COLUMNS})
+    types.update({col: pa.float64() for col in FLOAT_COLUMNS})
+    types['product_title'] = pa.string()
+    return types
+
+def write_parquet(csv_path):
+    """把一个国家 CSV（可压缩）流式转换成同名 .parquet，返回输出路径；未安装 pyarrow 时返回 None"""
+    if pa is None:
+        print('提示: 未安装 pyarrow，跳过 Parquet 输出（pip install pyarrow）')
+        return None
+    csv_path = Path(csv_path)
+    out_path = parquet_path(csv_path)
+    tmp_path = out_path.with_name(out_path.name + '.tmp')
+    convert = pacsv.ConvertOptions(column_types=arrow_column_types(),
+                                   strings_can_be_null=True, quoted_strings_can_be_null=False)
+    parse = pacsv.ParseOptions(newlines_in_values=True)
+    # 路径以 .gz / .zst 结尾时 pyarrow 会自动解压
+    reader = pacsv.open_csv(str(csv_path), parse_options=parse, convert_options=convert,
+                            read_options=pacsv.ReadOptions(block_size=16 * 1024 * 1024))
+    with pq.ParquetWriter(tmp_path, reader.schema, compression='zstd') as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+    tmp_path.replace(out_path)
+    return out_path
+
+def read_country_frame(csv_path, columns=None):
+    """读取国家数据为 DataFrame，只加载 columns 指定的列
+
+    同目录下有不比 CSV 旧的 .parquet 时直接读取列式文件，否则按 CSV_DTYPES 读取 CSV。
+    """
+    import pandas as pd
+    csv_path = Path(csv_path)
+    pq_path = parquet_path(csv_path)
+    if pa is not None and pq_path.exists() and pq_path.stat().st_mtime >= csv_path.stat().st_mtime:
+        return pd.read_parquet(pq_path, columns=columns)
+    if columns is not None:
+        dtypes = {col: dtype for col, dtype in CSV_DTYPES.items() if col in columns}
+    else:
+        dtypes = CSV_DTYPES
+    return pd.read_csv(csv_path, usecols=columns, dtype=dtypes)
+
+def load_category_groups(csv_path, route=None):
+    """读取一次国家数据并按 ranking_category 分组，返回 (DataFrame, {类目 code: 行号数组})
+
+    route 为 {code: 目标类目 code}（如 Taxonomy.level_map(2)）时按目标类目分组，每行只查一次字典。
+    """
+    df = read_country_frame(csv_path)
+    codes = df['ranking_category'].astype(str)
+    if route is not None:
+        codes = codes.map(route)
+    return df, codes.groupby(codes, sort=False).indices
+
+def select_categories(df, groups, codes):
+    """取出 ranking_category 属于 codes 的行，保持原有行顺序（与 isin 过滤结果一致）"""
+    import numpy as np
+    positions = [groups[code] for code in codes if code in groups]
+    if not positions:
+        return df.iloc[0:0]
+    return df.iloc[np.sort(np.concatenate(positions))]
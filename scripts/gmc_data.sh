@@ -24,6 +24,18 @@ BQ_PROJECT_ID="gmc-bestseller"
 #    !!! 重要: 请确保下方的表名是您想要查询的正确表名 !!!
 BQ_TABLE_NAME="gmc-bestseller.new_gmc_data.BestSellers_TopProducts_479974220"
 
+#    导出压缩格式: NONE（默认）或 GZIP。BigQuery 导出 CSV 只支持 GZIP 压缩。
+#    .csv.gz 只有 Python merge 脚本能直接读取（JS 脚本只处理 .csv），且压缩文件不能按字节区间并行切分，
+#    需要节省下载流量时再设置 EXPORT_COMPRESSION=GZIP
+EXPORT_COMPRESSION="${EXPORT_COMPRESSION:-NONE}"
+if [ "$EXPORT_COMPRESSION" = "GZIP" ]; then
+    EXPORT_SUFFIX=".csv.gz"
+    EXPORT_COMPRESSION_OPTION="  compression='GZIP',"
+else
+    EXPORT_SUFFIX=".csv"
+    EXPORT_COMPRESSION_OPTION=""
+fi
+
 # 5. BigQuery 导出数据的 SQL 查询 (使用可靠的字符串拼接方法)
 BQ_EXPORT_SQL="EXPORT DATA "
 BQ_EXPORT_SQL+="OPTIONS("
@@ -31,6 +43,7 @@ BQ_EXPORT_SQL+="  uri='GCS_URI_PLACEHOLDER',"
 BQ_EXPORT_SQL+="  format='CSV',"
 BQ_EXPORT_SQL+="  overwrite=true,"
 BQ_EXPORT_SQL+="  header=true,"
+BQ_EXPORT_SQL+="$EXPORT_COMPRESSION_OPTION"
 BQ_EXPORT_SQL+="  field_delimiter=',' "
 BQ_EXPORT_SQL+=") AS ( "
 BQ_EXPORT_SQL+="SELECT "
@@ -85,7 +98,7 @@ echo "GCS 清理命令已执行。"
 # 步骤 2: 从 BigQuery 导出数据到 GCS
 echo ""
 echo "--- 步骤 2: 从 BigQuery 导出数据到 GCS ---"
-EXPORT_URI="${GCS_BUCKET_NAME}/gmcdata-$(date +%F)-*.csv"
+EXPORT_URI="${GCS_BUCKET_NAME}/gmcdata-$(date +%F)-*${EXPORT_SUFFIX}"
 FINAL_SQL="${BQ_EXPORT_SQL//GCS_URI_PLACEHOLDER/$EXPORT_URI}"
 FINAL_SQL="${FINAL_SQL//BQ_TABLE_PLACEHOLDER/$BQ_TABLE_NAME}"
 echo "将从表 '$BQ_TABLE_NAME' 导出到 '$EXPORT_URI'"
@@ -0,0 +1,147 @@
+"""
+国家分片的行去重
+
+重复导出或重新导入归档目录时，同一行（国家、类目、排名、时间戳、标题都相同）会多次进入国家文件。
+record_fingerprint 把这几个字段哈希成 64 位整数，FingerprintSet 记录已经出现过的指纹：
+    - 先放在内存 set 中，超过内存预算时排序后写成一个 uint64 的 run 文件，清空内存继续
+    - run 文件用 mmap 映射，查询时二分查找；run 数超过 MAX_RUNS 时合并成一个
+每条指纹 8 字节落盘，几亿行也只需要几 GB 临时磁盘，内存占用不超过预算。
+
+记录需是 CANONICAL_HEADER 格式（国家拆分脚本的输出），标题之前的列不会包含引号和逗号。
+"""
+
+import os
+import mmap
+import heapq
+import bisect
+import shutil
+import hashlib
+import tempfile
+from array import array
+
+DEFAULT_MEMORY_MB = 512
+# 内存 set 中每个指纹的大致开销（int 对象 + 哈希表槽位）
+ENTRY_BYTES = 72
+MAX_RUNS = 8
+WRITE_BATCH = 1 << 20
+
+def _title_field(rest):
+    """取出记录剩余部分的第一个字段（product_title），带引号时保留引号原样"""
+    if not rest.startswith(b'"'):
+        return rest.split(b',', 1)[0].rstrip(b'\r\n')
+    i = 1
+    while True:
+        j = rest.find(b'"', i)
+        if j == -1:
+            return rest
+        if rest[j + 1:j + 2] == b'"':
+            i = j + 2
+            continue
+        return rest[:j + 1]
+
+def record_fingerprint(record):
+    """CANONICAL_HEADER 格式记录的 64 位指纹：(国家, 类目, 排名, 时间戳, 标题)"""
+    parts = record.split(b',', 5)
+    if len(parts) < 6:
+        key = record.rstrip(b'\r\n')
+    else:
+        timestamp, rank, _, country, category, rest = parts
+        key = b'\x1f'.join((country, category, rank, timestamp, _title_field(rest)))
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+class _Run:
+    """磁盘上一段已排序的指纹，mmap 后按 uint64 序列访问"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.values = memoryview(self._map).cast('Q')
+
+    def __contains__(self, fp):
+        i = bisect.bisect_left(self.values, fp)
+        return i < len(self.values) and self.values[i] == fp
+
+    def close(self):
+        self.values.release()
+        self._map.close()
+        self._file.close()
+        os.unlink(self.path)
+
+class FingerprintSet:
+    """有内存上限的指纹集合，超出预算的部分溢写到 spill_dir 下的临时文件"""
+
+    def __init__(self, memory_mb=DEFAULT_MEMORY_MB, spill_dir=None):
+        self.max_entries = max(1024, memory_mb * 1024 * 1024 // ENTRY_BYTES)
+        self._spill_dir = spill_dir
+        self._made_spill_dir = False
+        self._dir = None
+        self._memory = set()
+        self._runs = []
+        self._count = 0
+        self.spills = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, fp):
+        """加入指纹，之前没出现过返回 True"""
+        if fp in self._memory:
+            return False
+        for run in self._runs:
+            if fp in run:
+                return False
+        self._memory.add(fp)
+        self._count += 1
+        if len(self._memory) >= self.max_entries:
+            self._spill()
+        return True
+
+    def _new_run_path(self):
+        if self._dir is None:
+            if self._spill_dir is not None and not os.path.isdir(self._spill_dir):
+                os.makedirs(self._spill_dir)
+                self._made_spill_dir = True
+            self._dir = tempfile.mkdtemp(prefix='dedup_', dir=self._spill_dir)
+        self.spills += 1
+        return os.path.join(self._dir, f'run_{self.spills:06d}.u64')
+
+    def _write_run(self, values):
+        path = self._new_run_path()
+        buf = array('Q')
+        with open(path, 'wb') as f:
+            for fp in values:
+                buf.append(fp)
+                if len(buf) >= WRITE_BATCH:
+                    buf.tofile(f)
+                    buf = array('Q')
+            buf.tofile(f)
+        return _Run(path)
+
+    def _spill(self):
+        self._runs.append(self._write_run(sorted(self._memory)))
+        self._memory = set()
+        if len(self._runs) > MAX_RUNS:
+            # 各 run 之间没有重复，直接归并成一个
+            merged = self._write_run(heapq.merge(*(run.values for run in self._runs)))
+            for run in self._runs:
+                run.close()
+            self._runs = [merged]
+
+    def close(self):
+        for run in self._runs:
+            run.close()
+        self._runs = []
+        self._memory = set()
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+        if self._made_spill_dir:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._made_spill_dir = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
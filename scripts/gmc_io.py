@@ -0,0 +1,325 @@
+"""
+GMC 数据脚本共用的文件读写工具
+
+OutputPool: 按输出路径缓存已打开的 csv.writer，句柄数超过上限时关闭最久未使用的那个。
+用于流式拆分，每行直接写入对应文件，不再按文件缓存整批数据、也不再反复 open/close。
+
+count_quotes / align_ranges / iter_range_lines: 把一个大 CSV 切成按记录边界对齐的字节区间，
+供多个进程并行解析。引号内的换行不会被当作切分点。
+
+iter_raw_records: 按列号只取出路由字段，同时返回整条记录的原始字节，写出时原样复制，
+不经过 DictReader/DictWriter。只有带引号的记录才回退到 csv 模块解析。
+iter_record_spans 另外返回每条记录的起始字节偏移（计入被跳过的空行），用于建立按偏移读取的索引。
+
+open_input / open_output / open_text: 按扩展名透明读写 .csv.gz / .csv.zst。
+gzip 使用标准库；zstd 依赖 zstandard 包（可选）。压缩文件不能按字节区间切分，整文件作为一个任务。
+"""
+
+import io
+import os
+import csv
+import gzip
+from collections import OrderedDict
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_MAX_OPEN = 256
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+COMPRESSION_SUFFIXES = {'.gz': 'gz', '.zst': 'zst'}
+DEFAULT_COMPRESS_LEVEL = {'gz': 6, 'zst': 3}
+
+def compression_of(path):
+    """根据扩展名返回 'gz' / 'zst'，未压缩返回 None"""
+    return COMPRESSION_SUFFIXES.get(Path(path).suffix)
+
+def is_csv(path):
+    """是否是 CSV 文件（含 .csv.gz / .csv.zst）"""
+    name = Path(path).name
+    return name.endswith('.csv') or any(name.endswith('.csv' + s) for s in COMPRESSION_SUFFIXES)
+
+def csv_stem(path):
+    """去掉 .csv 及压缩扩展名后的文件名，如 US_1.csv.gz -> US_1"""
+    name = Path(path).name
+    if compression_of(name):
+        name = name[:-len(Path(name).suffix)]
+    return name[:-4] if name.endswith('.csv') else Path(name).stem
+
+def csv_name(stem, compression=None):
+    """按压缩方式生成文件名，如 ('US', 'gz') -> US.csv.gz"""
+    return f'{stem}.csv' + (f'.{compression}' if compression else '')
+
+def pandas_compression(path, level=None):
+    """DataFrame.to_csv 的 compression 参数"""
+    compression = compression_of(path)
+    if compression is None:
+        return None
+    if level is None:
+        level = DEFAULT_COMPRESS_LEVEL[compression]
+    if compression == 'gz':
+        return {'method': 'gzip', 'compresslevel': level}
+    return {'method': 'zstd', 'level': level}
+
+def add_compression_args(parser):
+    """给 argparse 增加统一的 --compress / --compress-level 参数"""
+    parser.add_argument('--compress', choices=sorted(DEFAULT_COMPRESS_LEVEL), default=None,
+                        help='输出文件压缩格式：gz 或 zst（zst 需要 zstandard），默认不压缩')
+    parser.add_argument('--compress-level', type=int, default=None,
+                        help='压缩级别，默认 gz=6、zst=3')
+
+def _gzip_file(raw, mode, level=9):
+    """在已打开的文件上创建 GzipFile，关闭时一并关闭底层文件"""
+    gz = gzip.GzipFile(fileobj=raw, mode=mode, compresslevel=level)
+    gz.myfileobj = raw
+    return gz
+
+def _require_zstd():
+    if zstandard is None:
+        raise RuntimeError('读写 .zst 文件需要安装 zstandard（pip install zstandard）')
+
+def open_input(path, fileobj=None):
+    """以二进制方式打开输入文件，压缩文件返回解压后的流
+
+    fileobj 可传入已打开的原始文件（例如边读边算哈希的包装），在其上解压。
+    """
+    compression = compression_of(path)
+    if compression is None:
+        return fileobj if fileobj is not None else open(path, 'rb')
+    raw = fileobj if fileobj is not None else open(path, 'rb')
+    if compression == 'gz':
+        return _gzip_file(raw, 'rb')
+    _require_zstd()
+    reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+    return io.BufferedReader(reader, DEFAULT_BUFFER_SIZE)
+
+def skip_bytes(f, n):
+    """在不可随机访问的解压流中向前跳过 n 个字节"""
+    while n > 0:
+        block = f.read(min(READ_BLOCK, n))
+        if not block:
+            break
+        n -= len(block)
+
+def open_output(path, mode='wb', level=None, buffer_size=None, compression=None):
+    """以二进制方式打开输出文件，按扩展名（或显式指定的 compression）压缩；mode 为 'wb' 或 'ab'
+
+    追加到压缩文件时会新增一个 gzip member / zstd frame，标准解压工具会把它们连续读出。
+    """
+    compression = compression or compression_of(path)
+    if compression is None:
+        return open(path, mode, buffering=buffer_size or -1)
+    if level is None:
+        level = DEFAULT_COMPRESS_LEVEL[compression]
+    raw = open(path, mode, buffering=buffer_size or -1)
+    if compression == 'gz':
+        return _gzip_file(raw, mode, level)
+    _require_zstd()
+    return zstandard.ZstdCompressor(level=level).stream_writer(raw, closefd=True)
+
+def open_text(path, mode='r', level=None):
+    """以文本方式打开（可能压缩的）CSV，供 csv.DictReader / csv.writer 使用；mode 为 'r' / 'w' / 'a'"""
+    if mode == 'r':
+        return io.TextIOWrapper(open_input(path), encoding='utf-8', newline='')
+    return io.TextIOWrapper(open_output(path, mode + 'b', level), encoding='utf-8', newline='')
+
+class OutputPool:
+    """LRU 限制的输出句柄池
+
+    header 为列名列表时是 csv 模式，writer(path) 返回该路径的 csv.writer；
+    header 为 bytes 时是原始字节模式，write(path, data) 直接写入记录字节。
+    首次写入空文件时先写表头。被淘汰的文件之后再次使用时以追加模式重新打开，不会重复写表头。
+    路径以 .gz / .zst 结尾时按 level 压缩写出。
+    """
+
+    def __init__(self, header, max_open=DEFAULT_MAX_OPEN, buffer_size=DEFAULT_BUFFER_SIZE, level=None):
+        self.header = header
+        self.raw = isinstance(header, bytes)
+        self.max_open = max(1, max_open)
+        self.buffer_size = buffer_size
+        self.level = level
+        self._open = OrderedDict()
+        self.paths = set()
+        self.opens = 0
+
+    def _entry(self, path):
+        entry = self._open.get(path)
+        if entry is not None:
+            self._open.move_to_end(path)
+            return entry
+        if len(self._open) >= self.max_open:
+            _, (old_handle, _) = self._open.popitem(last=False)
+            old_handle.close()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        is_empty = not os.path.exists(path) or os.path.getsize(path) == 0
+        handle = open_output(path, 'ab', self.level, self.buffer_size)
+        writer = None
+        if not self.raw:
+            handle = io.TextIOWrapper(handle, encoding='utf-8', newline='')
+            writer = csv.writer(handle)
+        if is_empty and self.header:
+            if self.raw:
+                handle.write(self.header)
+            else:
+                writer.writerow(self.header)
+        entry = self._open[path] = (handle, writer)
+        self.paths.add(path)
+        self.opens += 1
+        return entry
+
+    def writer(self, path):
+        return self._entry(path)[1]
+
+    def write(self, path, data):
+        self._entry(path)[0].write(data)
+
+    def flush(self):
+        """把缓冲写到磁盘，使文件大小可以作为检查点；压缩文件需要关闭才能形成完整的 member/frame"""
+        for path in list(self._open):
+            if compression_of(path):
+                self._open.pop(path)[0].close()
+            else:
+                self._open[path][0].flush()
+
+    def close(self):
+        while self._open:
+            _, (handle, _) = self._open.popitem(last=False)
+            handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+READ_BLOCK = 4 * 1024 * 1024
+
+def raw_bounds(path, chunk_bytes):
+    """按固定大小给出未对齐的切分点（不含 0 和文件末尾）；压缩文件不切分"""
+    if compression_of(path):
+        return []
+    size = os.path.getsize(path)
+    return [pos for pos in range(chunk_bytes, size, chunk_bytes)]
+
+def count_quotes(task):
+    """统计 [start, end) 内双引号的个数，可在子进程中并行执行"""
+    path, start, end = task
+    total = 0
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(READ_BLOCK, remaining))
+            if not block:
+                break
+            total += block.count(b'"')
+            remaining -= len(block)
+    return total
+
+def align_ranges(path, bounds, quote_counts):
+    """把切分点移动到下一个真正的记录结尾（引号外的换行符之后）
+
+    bounds 是升序的原始切分点，quote_counts[i] 是第 i 段（bounds[i-1] 到 bounds[i]）内的引号数，
+    由此可以知道每个切分点处是否位于引号内，只需从切分点向后扫描到第一个合法换行即可。
+    返回覆盖整个文件的 [(start, end), ...]，空区间会被去掉。
+    """
+    size = os.path.getsize(path)
+    aligned = []
+    parity = 0
+    with open(path, 'rb') as f:
+        for i, bound in enumerate(bounds):
+            parity = (parity + quote_counts[i]) % 2
+            in_quotes = parity
+            pos = bound
+            f.seek(bound)
+            found = None
+            while found is None:
+                block = f.read(READ_BLOCK)
+                if not block:
+                    found = size
+                    break
+                start = 0
+                while True:
+                    nl = block.find(b'\n', start)
+                    if nl == -1:
+                        in_quotes = (in_quotes + block.count(b'"', start)) % 2
+                        break
+                    in_quotes = (in_quotes + block.count(b'"', start, nl)) % 2
+                    if not in_quotes:
+                        found = pos + nl + 1
+                        break
+                    start = nl + 1
+                pos += len(block)
+            aligned.append(found)
+    edges = [0] + aligned + [size]
+    return [(edges[i], edges[i + 1]) for i in range(len(edges) - 1) if edges[i] < edges[i + 1]]
+
+def iter_range_lines(path, start, end, encoding='utf-8'):
+    """逐行读取 [start, end) 字节区间并解码，可直接交给 csv.reader；encoding=None 时返回原始字节
+
+    end 为 None 时读到文件末尾（压缩文件只能这样整文件读取）。
+    """
+    with open_input(path) as f:
+        if start:
+            f.seek(start)
+        pos = start
+        while end is None or pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            yield line.decode(encoding) if encoding else line
+
+def read_header_line(path):
+    """读取表头所在的原始字节行（含换行符）"""
+    with open_input(path) as f:
+        return f.readline()
+
+def iter_raw_records(lines, column, encoding='utf-8'):
+    """从字节行迭代器中逐条取出记录，返回 (第 column 列的字节值, 记录原始字节)
+
+    不含引号的行直接按逗号切分；含引号的行先补齐引号内换行造成的后续行，
+    只有路由字段本身位于引号之后时才用 csv 模块解析这一条记录。
+    空行会被跳过，缺少该列的记录返回 b''。
+    column 也可以是列号的元组，此时第一项返回各列字节值组成的元组。
+    """
+    for value, record, _ in iter_record_spans(lines, column, encoding=encoding):
+        yield value, record
+
+def iter_record_spans(lines, column, offset=0, encoding='utf-8'):
+    """与 iter_raw_records 相同，另外返回记录的起始字节偏移：(字段值, 记录原始字节, 起始偏移)
+
+    offset 为第一行在文件中的位置。被跳过的空行也计入偏移，
+    记录在文件中占 [起始偏移, 起始偏移 + len(记录)) 字节，不能用 len(记录) 累加代替。
+    """
+    columns = column if isinstance(column, tuple) else (column,)
+    last = max(columns)
+    lines = iter(lines)
+    pos = offset
+    for line in lines:
+        if line == b'\n' or line == b'\r\n':
+            pos += len(line)
+            continue
+        quote = line.find(b'"')
+        if quote != -1:
+            while line.count(b'"') % 2:
+                more = next(lines, None)
+                if more is None:
+                    break
+                line += more
+        parts = line.split(b',', last + 1)
+        # 路由字段完全位于第一个引号之前时，切分结果一定正确
+        if len(parts) > last and (quote == -1 or quote > sum(len(p) for p in parts[:last + 1]) + last):
+            if len(parts) == last + 1:
+                parts[last] = parts[last].rstrip(b'\r\n')
+            values = tuple(parts[c] for c in columns)
+        elif len(parts) <= last and quote == -1:
+            values = tuple(parts[c].rstrip(b'\r\n') if c < len(parts) else b'' for c in columns)
+        else:
+            fields = next(csv.reader([line.decode(encoding)]), [])
+            values = tuple(fields[c].encode(encoding) if len(fields) > c else b'' for c in columns)
+        yield (values if columns is column else values[0]), line, pos
+        pos += len(line)
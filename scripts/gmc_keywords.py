@@ -0,0 +1,94 @@
+"""
+多关键词一次匹配
+
+关键词订阅要为同一个国家提取很多个关键词，逐个运行 merge_gmc_by_country_keyword.py 会把国家文件扫描很多遍。
+KeywordAutomaton 把全部关键词（已小写）编成一个 Aho-Corasick 自动机，每个标题只遍历一次，
+就能找出其中作为子串出现的全部关键词，与逐个关键词 `keyword in title.lower()` 的结果相同。
+
+安装了 pyahocorasick（import ahocorasick，可选）时用它的 C 实现，否则用纯 Python 实现。
+"""
+
+from collections import deque
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+def read_keywords(path):
+    """读取关键词文件：每行一个关键词（可含空格、逗号），首尾空白忽略，空行和 # 开头的行跳过，去重并保持顺序"""
+    keywords = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            keyword = line.strip()
+            if keyword and not keyword.startswith('#'):
+                keywords.append(keyword)
+    return list(dict.fromkeys(keywords))
+
+class KeywordAutomaton:
+    """search(text) 返回 text 中出现的关键词在 keywords 中的下标集合；关键词与 text 都应已小写"""
+
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        # 空关键词是任何标题的子串
+        self._always = frozenset(i for i, keyword in enumerate(self.keywords) if not keyword)
+        if ahocorasick is not None:
+            indexes = {}
+            for i, keyword in enumerate(self.keywords):
+                if keyword:
+                    indexes.setdefault(keyword, []).append(i)
+            self._automaton = ahocorasick.Automaton()
+            for keyword, keyword_indexes in indexes.items():
+                self._automaton.add_word(keyword, tuple(keyword_indexes))
+            if len(self._automaton):
+                self._automaton.make_automaton()
+            else:
+                self._automaton = None
+            return
+        self._automaton = None
+        # goto[状态] = {字符: 下一状态}，out[状态] = 到达该状态时匹配到的关键词下标（含失败链上的）
+        goto = [{}]
+        out = [()]
+        for i, keyword in enumerate(self.keywords):
+            state = 0
+            for ch in keyword:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = goto[state][ch] = len(goto)
+                    goto.append({})
+                    out.append(())
+                state = nxt
+            if state:
+                out[state] += (i,)
+        # 按层次建立失败指针：状态对应字符串的最长真后缀所在的状态
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] += out[fail[nxt]]
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def search(self, text):
+        found = set(self._always)
+        if ahocorasick is not None:
+            if self._automaton is not None:
+                for _, indexes in self._automaton.iter(text):
+                    found.update(indexes)
+            return found
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
@@ -0,0 +1,222 @@
+"""
+国家拆分脚本的输入清单（ingest manifest）
+
+清单记录每个输入文件的大小、修改时间、内容哈希和已提交的字节偏移，
+以及提交时各国家输出文件的大小。重新运行时：
+    - 已完成且未变化的文件直接跳过
+    - 中断的文件先把输出截断回上次提交的大小，再从记录的偏移继续
+清单保存在 gmc_data/output/.ingest_manifest.json，gmc_data.sh 删除 output 目录时会一起清掉。
+
+并行版本按字节区间处理，每个区间完成后在临时目录写一个 TaskMarker，
+重跑时区间未变化（大小、修改时间或内容哈希一致）就直接复用已有的分片。
+
+类目拆分脚本在每个国家目录下写 .category_manifest.json（CategoryManifest），按层级列出
+每个类目输出文件的相对路径和行数。稀疏模式（--sparse）不再生成只有表头的空类目文件，
+清单里没有的类目即为 0 条，下游按清单取文件即可，不必遍历目录。
+"""
+
+import io
+import os
+import json
+import hashlib
+from pathlib import Path
+
+MANIFEST_NAME = '.ingest_manifest.json'
+CATEGORY_MANIFEST_NAME = '.category_manifest.json'
+HASH_BLOCK = 4 * 1024 * 1024
+
+def file_digest(path, start=0, end=None):
+    """计算文件 [start, end) 字节区间（默认整个文件）的 blake2b 哈希"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = None if end is None else end - start
+        while remaining is None or remaining > 0:
+            block = f.read(HASH_BLOCK if remaining is None else min(HASH_BLOCK, remaining))
+            if not block:
+                break
+            h.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return h.hexdigest()
+
+class HashingReader(io.RawIOBase):
+    """读取时顺便计算哈希的原始文件包装，外面再套 BufferedReader 使用
+
+    resume_from > 0 时先读取并哈希文件前缀，底层文件随后正好停在该偏移处。
+    """
+
+    def __init__(self, path, resume_from=0):
+        self._f = open(path, 'rb', buffering=0)
+        self.hash = hashlib.blake2b(digest_size=16)
+        remaining = resume_from
+        while remaining > 0:
+            block = self._f.read(min(HASH_BLOCK, remaining))
+            if not block:
+                break
+            self.hash.update(block)
+            remaining -= len(block)
+        self._pos = resume_from
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self._f.readinto(b)
+        if n:
+            self.hash.update(memoryview(b)[:n])
+            self._pos += n
+        return n
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+class IngestManifest:
+    def __init__(self, path, data=None):
+        self.path = Path(path)
+        data = data or {}
+        self.files = data.get('files', {})
+        self.outputs = data.get('outputs', {})
+        self.exists = bool(data)
+
+    @classmethod
+    def load(cls, output_dir):
+        path = Path(output_dir) / MANIFEST_NAME
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(path, json.load(f))
+        return cls(path)
+
+    def save(self):
+        """原子写入：先写临时文件再替换，保证清单本身不会半写"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.files, 'outputs': self.outputs}, f, ensure_ascii=False, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.exists = True
+
+    def status(self, file):
+        """判断输入文件的处理状态
+
+        返回 (状态, 起始偏移)，状态为 'new' / 'done' / 'resume' / 'changed'。
+        大小和修改时间一致时直接信任清单；只有修改时间变化时才重新计算哈希确认内容。
+        """
+        entry = self.files.get(Path(file).name)
+        if entry is None:
+            return 'new', 0
+        st = os.stat(file)
+        if st.st_size != entry['size']:
+            return 'changed', 0
+        if st.st_mtime_ns == entry['mtime']:
+            return ('done', 0) if entry['done'] else ('resume', entry['offset'])
+        if entry['done'] and entry.get('hash') == file_digest(file):
+            entry['mtime'] = st.st_mtime_ns
+            return 'done', 0
+        return 'changed', 0
+
+    def begin(self, file):
+        st = os.stat(file)
+        entry = self.files[Path(file).name] = {
+            'size': st.st_size, 'mtime': st.st_mtime_ns, 'hash': None,
+            'offset': 0, 'rows': 0, 'done': False,
+        }
+        return entry
+
+    def commit(self, file, offset, rows, output_sizes, digest=None):
+        """记录检查点：输入已处理到 offset，各输出文件的有效大小为 output_sizes"""
+        entry = self.files[Path(file).name]
+        entry['offset'] = offset
+        entry['rows'] = rows
+        if digest is not None:
+            entry['hash'] = digest
+            entry['done'] = True
+        self.outputs = dict(output_sizes)
+        self.save()
+
+    def rollback(self, output_dir, outputs):
+        """把输出文件恢复到上次提交的状态：截断多写的部分，删除未提交过的文件
+
+        outputs 是当前磁盘上存在的输出文件相对路径列表。
+        """
+        for rel in outputs:
+            path = Path(output_dir) / rel
+            committed = self.outputs.get(rel)
+            if committed is None:
+                path.unlink()
+            elif path.stat().st_size > committed:
+                with open(path, 'r+b') as f:
+                    f.truncate(committed)
+
+class TaskMarker:
+    """并行分片任务的完成标记，保存在任务分片目录下的 done.json"""
+
+    NAME = 'done.json'
+
+    @staticmethod
+    def write(part_dir, file, start, end, digest, counts):
+        st = os.stat(file)
+        data = {'file': Path(file).name, 'size': st.st_size, 'mtime': st.st_mtime_ns,
+                'start': start, 'end': end, 'hash': digest, 'counts': counts}
+        tmp = Path(part_dir) / (TaskMarker.NAME + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, Path(part_dir) / TaskMarker.NAME)
+
+    @staticmethod
+    def load(part_dir, file, start, end):
+        """返回可复用任务的国家计数；标记不存在或输入已变化时返回 None"""
+        path = Path(part_dir) / TaskMarker.NAME
+        if not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        st = os.stat(file)
+        if (data['file'], data['size'], data['start'], data['end']) != (Path(file).name, st.st_size, start, end):
+            return None
+        if data['mtime'] != st.st_mtime_ns and data['hash'] != file_digest(file, start, end):
+            return None
+        return data['counts']
+
+class CategoryManifest:
+    """国家目录下的类目拆分清单：{'levels': {'<层级>': {code: {'path': 相对路径, 'rows': 行数}}}}"""
+
+    def __init__(self, country_dir, data=None):
+        self.country_dir = Path(country_dir)
+        self.path = self.country_dir / CATEGORY_MANIFEST_NAME
+        self.levels = (data or {}).get('levels', {})
+
+    @classmethod
+    def load(cls, country_dir):
+        path = Path(country_dir) / CATEGORY_MANIFEST_NAME
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(country_dir, json.load(f))
+        return cls(country_dir)
+
+    def reset(self, level):
+        """重新拆分某一层级前清空它的旧记录"""
+        self.levels[str(level)] = {}
+
+    def record(self, level, code, path, rows):
+        self.levels.setdefault(str(level), {})[code] = {
+            'path': Path(path).relative_to(self.country_dir).as_posix(), 'rows': rows,
+        }
+
+    def entries(self, level):
+        """{code: (绝对路径, 行数)}"""
+        return {code: (self.country_dir / entry['path'], entry['rows'])
+                for code, entry in self.levels.get(str(level), {}).items()}
+
+    def save(self):
+        self.country_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'levels': self.levels}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
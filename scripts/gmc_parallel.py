@@ -0,0 +1,89 @@
+"""
+按内存预算并行处理各国家
+
+类目拆分脚本每个国家相互独立，可以放进进程池同时处理；但二/三级拆分会把整个国家文件读成 DataFrame，
+US 这类大国家同时跑几个就可能把机器内存用完。run_budgeted 按估算的内存占用准入任务：
+    - 任务按估算内存从大到小提交，最大的国家最先开始，总用时接近最大国家的用时
+    - 正在运行的任务估算内存之和不超过预算；单个任务超过预算时等其他任务结束后单独运行
+估算只看文件大小：DataFrame 约为 CSV 字节数的 FRAME_EXPANSION 倍，压缩文件先按 COMPRESSED_RATIO 折算成原始大小；
+按类目分组写出的任务用 estimate_grouped_mb 估算。
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from gmc_io import compression_of
+
+FRAME_EXPANSION = 3
+COMPRESSED_RATIO = 5
+# 逐行流式处理（不建 DataFrame）的任务按固定开销估算
+STREAM_MB = 64
+# 按类目分组写出（gmc_shared）时每条记录偏移占用的内存约为 CSV 字节数的 1/SPAN_RATIO
+SPAN_RATIO = 4
+
+def default_memory_budget_mb():
+    """默认预算为物理内存的一半，取不到时按 4GB"""
+    try:
+        total = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return 4096
+    return max(1024, total // (1024 * 1024) // 2)
+
+def estimate_frame_mb(csv_files):
+    """把国家文件读成 DataFrame 时的峰值内存估算（MB），同一国家的多个文件依次处理，取最大的一个"""
+    largest = 0
+    for csv_file in csv_files:
+        size = os.path.getsize(csv_file)
+        if compression_of(csv_file):
+            size *= COMPRESSED_RATIO
+        largest = max(largest, size)
+    return STREAM_MB + largest * FRAME_EXPANSION // (1024 * 1024)
+
+def estimate_grouped_mb(csv_files):
+    """按类目分组写出时的峰值内存估算（MB）：未压缩文件 mmap 读取，只计记录偏移；压缩文件还要放下解压后的数据"""
+    largest = 0
+    for csv_file in csv_files:
+        size = os.path.getsize(csv_file)
+        if compression_of(csv_file):
+            size *= COMPRESSED_RATIO
+            size += size // SPAN_RATIO
+        else:
+            size //= SPAN_RATIO
+        largest = max(largest, size)
+    return STREAM_MB + largest // (1024 * 1024)
+
+def add_parallel_args(parser):
+    parser.add_argument('--workers', type=int, default=1,
+                        help='同时处理的国家数（进程数），默认 1 表示在主进程内逐个处理')
+    parser.add_argument('--memory-budget', type=int, default=default_memory_budget_mb(),
+                        help='并行时所有进程估算内存之和的上限（MB），默认为物理内存的一半')
+
+def run_budgeted(func, jobs, workers=1, memory_mb=None):
+    """jobs 为 [(估算内存MB, 参数元组)]，按完成顺序逐个产出 func(*参数) 的结果
+
+    估算相同的任务保持传入顺序；workers <= 1 时在主进程内按原顺序执行。
+    """
+    if workers <= 1:
+        for _, args in jobs:
+            yield func(*args)
+        return
+    budget = memory_mb if memory_mb is not None else default_memory_budget_mb()
+    pending = sorted(jobs, key=lambda job: job[0], reverse=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        running = {}
+        used = 0
+        while pending or running:
+            # 从大到小找预算内放得下的任务；没有任务在运行时，超预算的任务也单独放行
+            i = 0
+            while i < len(pending) and len(running) < workers:
+                cost, args = pending[i]
+                if not running or used + cost <= budget:
+                    running[pool.submit(func, *args)] = cost
+                    used += cost
+                    pending.pop(i)
+                else:
+                    i += 1
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                used -= running.pop(future)
+                yield future.result()
@@ -0,0 +1,407 @@
+"""
+按字段组合条件的查询语言
+
+    title:"dog food" AND NOT brand:Purina AND price<50 AND demand>=high AND category:1
+
+语法：
+    - 条件用 AND / OR / NOT（大写）和括号组合，优先级 NOT > AND > OR；相邻的两个条件省略 AND 时按 AND 处理
+    - 条件写成 字段:值 或 字段 比较符 值，比较符为 < <= > >= = !=
+    - 值含空格或特殊字符时加双引号，引号内用 "" 表示一个引号；没有字段的值按 title:值 处理
+字段：
+    title                    product_title 包含该文本（忽略大小写，与关键词模式相同），只支持 :
+    brand / country / currency 及其它文本列    忽略大小写完全相等，: 与 = 相同
+    price                    price_min；price_min / price_max、rank / previous_rank 等数值列按数值比较，: 与 = 相同
+    demand / previous_demand 需求档位，按 Very low < Low < Medium < High < Very high 比较，值可写 high、"very high"、very_high
+    category                 ranking_category 属于该类目的子树（含自身），: 与 = 相同
+!= 是 = 的取反，值为空的行也算不相等；其它比较遇到空值都不成立。
+
+compile_query 只解析一次，生成 QueryPlan；QueryPlan.evaluate 在 DataFrame 的带类型列上向量化求值：
+    - 文本、类目、需求档位列按 pandas category 的字典求值，每个不同值只判断一次，再按编码取出各行结果
+    - AND 的条件按抽样估计的选择率和代价排序（代价 / 排除比例 越小越先算），后面的条件只在剩下的行上计算
+    - OR 的分支按 代价 / 命中比例 排序，后面的分支只在还没命中的行上计算
+select_records 只读取查询用到的列求出命中的行，再按行号原样复制国家文件中的记录。
+"""
+
+import re
+
+from gmc_schema import CANONICAL_HEADER, INT_FIELDS, FLOAT_FIELDS, DEMAND_BUCKETS, demand_level
+
+# 估计选择率时抽样的行数
+SAMPLE_SIZE = 2000
+# 各类条件对每行的相对代价：文本包含要逐行小写、查找，其余条件都是数组比较
+COSTS = {'number': 1, 'demand': 1, 'category': 1, 'text': 1, 'contains': 20}
+
+FIELD_ALIASES = {
+    'title': 'product_title',
+    'brand': 'brand',
+    'country': 'ranking_country',
+    'currency': 'price_currency',
+    'price': 'price_min',
+    'demand': 'relative_demand_bucket',
+    'previous_demand': 'previous_relative_demand_bucket',
+    'category': 'ranking_category',
+    'timestamp': 'rank_timestamp',
+}
+COMPARISONS = ('<', '<=', '>', '>=', '=', '!=')
+
+_TOKEN_RE = re.compile(r'\s*(?:(?P<op><=|>=|!=|[<>=:])|(?P<paren>[()])|"(?P<quoted>(?:[^"]|"")*)"'
+                       r'|(?P<word>[^\s()<>=!:"]+))')
+
+class QueryError(ValueError):
+    """查询语法错误或字段、值无效"""
+
+def column_kind(column):
+    if column == 'product_title':
+        return 'contains'
+    if column == 'ranking_category':
+        return 'category'
+    if column in ('relative_demand_bucket', 'previous_relative_demand_bucket'):
+        return 'demand'
+    if column in INT_FIELDS or column in FLOAT_FIELDS:
+        return 'number'
+    return 'text'
+
+def _compare(op, left, right):
+    import numpy as np
+    return {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal,
+            '=': np.equal}[op](left, right)
+
+class _Columns:
+    """求值时按列缓存的数组：数值列为 float64（空值为 nan），字典列为 (编码, 字典值)"""
+
+    def __init__(self, df):
+        self.df = df
+        self.rows = len(df)
+        self._cache = {}
+
+    def numbers(self, column):
+        import numpy as np
+        import pandas as pd
+        if column not in self._cache:
+            values = pd.to_numeric(self.df[column], errors='coerce')
+            self._cache[column] = values.to_numpy(dtype='float64', na_value=np.nan)
+        return self._cache[column]
+
+    def codes(self, column):
+        import pandas as pd
+        if column not in self._cache:
+            series = self.df[column]
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                series = series.astype('category')
+            self._cache[column] = (series.cat.codes.to_numpy(), [str(value) for value in series.cat.categories])
+        return self._cache[column]
+
+    def texts(self, column):
+        if column not in self._cache:
+            self._cache[column] = self.df[column].fillna('').astype(str).to_numpy(dtype=object)
+        return self._cache[column]
+
+class Predicate:
+    """单个字段条件"""
+
+    def __init__(self, column, op, value, text, taxonomy=None):
+        self.column = column
+        self.kind = column_kind(column)
+        self.op = '=' if op == ':' else op
+        self.text = text
+        self.cost = COSTS[self.kind]
+        self.selectivity = 1.0
+        if self.kind == 'contains':
+            if op != ':':
+                raise QueryError(f'{text}: 标题只支持 title:文本（包含）')
+            self.value = value.lower()
+        elif self.kind == 'number':
+            try:
+                self.value = float(value)
+            except ValueError:
+                raise QueryError(f'{text}: {value} 不是数字')
+        elif self.kind == 'demand':
+            self.value = demand_level(value.replace('_', ' '))
+            if self.value is None:
+                raise QueryError(f'{text}: 无效的需求档位 {value}，可选 {", ".join(DEMAND_BUCKETS)}')
+        else:
+            if self.op not in ('=', '!='):
+                raise QueryError(f'{text}: 文本字段只支持 :、= 和 !=')
+            if self.kind == 'category':
+                if value not in taxonomy:
+                    raise QueryError(f'{text}: categories.json 中没有类目 {value}')
+                self.value = set(taxonomy.descendants(value))
+            else:
+                self.value = value.lower()
+
+    @property
+    def columns(self):
+        return {self.column}
+
+    def _dictionary_table(self, categories):
+        """字典中每个值是否满足条件，最后一项对应空值（编码 -1）"""
+        import numpy as np
+        if self.kind == 'demand':
+            levels = np.array([-1 if level is None else level
+                               for level in map(demand_level, categories)] + [-1])
+            op = '=' if self.op == '!=' else self.op
+            return _compare(op, levels, self.value) & (levels >= 0)
+        if self.kind == 'category':
+            return np.array([value in self.value for value in categories] + [False])
+        return np.array([value.lower() == self.value for value in categories] + [False])
+
+    def mask(self, columns, rows):
+        import numpy as np
+        import pandas as pd
+        if self.kind == 'contains':
+            titles = pd.Series(columns.texts(self.column)[rows], dtype=object)
+            return titles.str.lower().str.contains(self.value, regex=False).to_numpy(dtype=bool)
+        if self.kind == 'number':
+            values = columns.numbers(self.column)[rows]
+            if self.op == '!=':
+                return ~np.equal(values, self.value)
+            return _compare(self.op, values, self.value)
+        codes, categories = columns.codes(self.column)
+        result = self._dictionary_table(categories)[codes[rows]]
+        return ~result if self.op == '!=' else result
+
+    def prepare(self, columns, sample):
+        if len(sample):
+            self.selectivity = float(self.mask(columns, sample).mean())
+
+    def select(self, columns, rows):
+        if not len(rows):
+            return rows
+        return rows[self.mask(columns, rows)]
+
+    def explain(self, depth=0):
+        return ['  ' * depth + f'{self.text}  (选择率≈{self.selectivity:.3f})']
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+        self.cost = child.cost
+        self.selectivity = 1.0
+
+    @property
+    def columns(self):
+        return self.child.columns
+
+    def prepare(self, columns, sample):
+        self.child.prepare(columns, sample)
+        self.selectivity = 1.0 - self.child.selectivity
+
+    def select(self, columns, rows):
+        import numpy as np
+        return np.setdiff1d(rows, self.child.select(columns, rows), assume_unique=True)
+
+    def explain(self, depth=0):
+        return ['  ' * depth + 'NOT'] + self.child.explain(depth + 1)
+
+class And:
+    def __init__(self, children):
+        self.children = children
+        self.cost = sum(child.cost for child in children)
+        self.selectivity = 1.0
+
+    @property
+    def columns(self):
+        return set().union(*(child.columns for child in self.children))
+
+    def prepare(self, columns, sample):
+        for child in self.children:
+            child.prepare(columns, sample)
+        # 单位排除比例代价小的先算
+        self.children.sort(key=lambda child: child.cost / max(1.0 - child.selectivity, 1e-6))
+        self.selectivity = 1.0
+        for child in self.children:
+            self.selectivity *= child.selectivity
+
+    def select(self, columns, rows):
+        for child in self.children:
+            if not len(rows):
+                break
+            rows = child.select(columns, rows)
+        return rows
+
+    def explain(self, depth=0):
+        return ['  ' * depth + 'AND'] + [line for child in self.children for line in child.explain(depth + 1)]
+
+class Or:
+    def __init__(self, children):
+        self.children = children
+        self.cost = sum(child.cost for child in children)
+        self.selectivity = 1.0
+
+    @property
+    def columns(self):
+        return set().union(*(child.columns for child in self.children))
+
+    def prepare(self, columns, sample):
+        for child in self.children:
+            child.prepare(columns, sample)
+        # 单位命中比例代价小的先算
+        self.children.sort(key=lambda child: child.cost / max(child.selectivity, 1e-6))
+        missed = 1.0
+        for child in self.children:
+            missed *= 1.0 - child.selectivity
+        self.selectivity = 1.0 - missed
+
+    def select(self, columns, rows):
+        import numpy as np
+        matched = []
+        for child in self.children:
+            if not len(rows):
+                break
+            hits = child.select(columns, rows)
+            matched.append(hits)
+            rows = np.setdiff1d(rows, hits, assume_unique=True)
+        if not matched:
+            return rows
+        return np.sort(np.concatenate(matched))
+
+    def explain(self, depth=0):
+        return ['  ' * depth + 'OR'] + [line for child in self.children for line in child.explain(depth + 1)]
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        if text[pos:].isspace():
+            break
+        match = _TOKEN_RE.match(text, pos)
+        if match is None or match.end() == pos:
+            raise QueryError(f'第 {pos + 1} 个字符附近无法解析: {text[pos:pos + 20]!r}')
+        if match.group('op'):
+            tokens.append(('op', match.group('op')))
+        elif match.group('paren'):
+            tokens.append((match.group('paren'), match.group('paren')))
+        elif match.group('quoted') is not None:
+            tokens.append(('value', match.group('quoted').replace('""', '"')))
+        else:
+            word = match.group('word')
+            tokens.append(('keyword', word) if word in ('AND', 'OR', 'NOT') else ('word', word))
+        pos = match.end()
+    return tokens
+
+class _Parser:
+    def __init__(self, text, taxonomy):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+        self._taxonomy = taxonomy
+
+    def taxonomy(self):
+        if self._taxonomy is None:
+            from gmc_taxonomy import Taxonomy
+            self._taxonomy = Taxonomy.load()
+        return self._taxonomy
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise QueryError('查询为空')
+        node = self.parse_or()
+        if self.pos < len(self.tokens):
+            raise QueryError(f'多余的内容: {self.peek()[1]}')
+        return node
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == ('keyword', 'OR'):
+            self.take()
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while True:
+            kind, value = self.peek()
+            if (kind, value) == ('keyword', 'AND'):
+                self.take()
+            elif not (kind in ('word', 'value', '(') or (kind, value) == ('keyword', 'NOT')):
+                break
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else And(children)
+
+    def parse_not(self):
+        if self.peek() == ('keyword', 'NOT'):
+            self.take()
+            return Not(self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind, value = self.take()
+        if kind == '(':
+            node = self.parse_or()
+            if self.take()[0] != ')':
+                raise QueryError('缺少右括号')
+            return node
+        if kind == 'word' and self.peek()[0] == 'op':
+            op = self.take()[1]
+            value_kind, operand = self.take()
+            if value_kind not in ('word', 'value'):
+                raise QueryError(f'{value}{op} 后缺少值')
+            return self.predicate(value, op, operand)
+        if kind in ('word', 'value'):
+            return Predicate('product_title', ':', value, f'title:{value}')
+        raise QueryError(f'此处需要条件: {value if value is not None else "查询结尾"}')
+
+    def predicate(self, field, op, value):
+        name = field.lower()
+        column = FIELD_ALIASES.get(name, name)
+        if column not in CANONICAL_HEADER:
+            raise QueryError(f'未知字段: {field}，可用 {", ".join(FIELD_ALIASES)} 或原始列名')
+        if op != ':' and op not in COMPARISONS:
+            raise QueryError(f'未知比较符: {op}')
+        taxonomy = self.taxonomy() if column == 'ranking_category' else None
+        return Predicate(column, op, value, f'{field}{op}{value}', taxonomy)
+
+class QueryPlan:
+    """解析后的查询；columns 为求值需要读取的列"""
+
+    def __init__(self, root, text):
+        self.root = root
+        self.text = text
+        self.columns = sorted(root.columns)
+
+    def evaluate(self, df):
+        """返回 df 中满足查询的行号（升序）"""
+        import numpy as np
+        columns = _Columns(df)
+        rows = np.arange(len(df))
+        if len(rows) > SAMPLE_SIZE:
+            sample = np.sort(np.random.default_rng(0).choice(len(rows), SAMPLE_SIZE, replace=False))
+        else:
+            sample = rows
+        self.root.prepare(columns, sample)
+        return self.root.select(columns, rows)
+
+    def explain(self):
+        """按实际求值顺序列出条件；evaluate 之后带有估计的选择率"""
+        return '\n'.join(self.root.explain())
+
+def compile_query(text, taxonomy=None):
+    """解析查询，语法或字段错误时抛出 QueryError；用到 category 时按需加载 categories.json"""
+    return QueryPlan(_Parser(text, taxonomy).parse(), text)
+
+def select_records(csv_path, plan):
+    """对一个国家文件求值查询，按文件顺序逐条返回命中记录的原始字节"""
+    import numpy as np
+    from gmc_columnar import read_country_frame
+    from gmc_scan import iter_candidate_records
+
+    df = read_country_frame(csv_path, columns=plan.columns)
+    wanted = np.zeros(len(df), dtype=bool)
+    wanted[plan.evaluate(df)] = True
+    i = 0
+    for _, record in iter_candidate_records(csv_path, 0):
+        # 与 read_csv 一致，空行不算一行
+        if not record.strip():
+            continue
+        if i >= len(wanted):
+            raise ValueError(f'{csv_path} 的记录数与读取到的行数不一致')
+        if wanted[i]:
+            yield record
+        i += 1
@@ -0,0 +1,131 @@
+"""
+基于 mmap 的字节级候选扫描
+
+按类目或关键词筛选时绝大多数行都会被丢弃，逐行切分、解码仍然要处理整个文件。
+scan_candidates 把未压缩的国家文件 mmap 进来，在整个文件上用 C 实现的查找（bytes.find / 正则）定位候选，
+只对命中位置所在的那条记录确定边界、取出路由字段交给调用方校验，其余字节不切分也不解码。
+
+记录边界：从上一条已处理记录的结尾（一定是记录边界）数到候选位置所在行首之间的引号个数，
+偶数说明行首在引号外，就是记录起点；奇数说明换行在引号内，再往前找。记录结尾同理向后补齐引号。
+
+候选必须是真实匹配的超集，调用方再用原来的规则校验：
+    - keyword_finder：纯 ASCII 关键词，按块 bytes.lower() 后查找；str.lower() 会把 İ、K（开尔文符号）
+      变成 ASCII 字母，含这两个字符的位置也作为候选
+    - category_finder：两侧为逗号的类目 code，多个 code 编成前缀树正则
+压缩文件无法 mmap，调用方回退到流式扫描。
+"""
+
+import re
+import heapq
+import mmap
+
+from gmc_io import iter_raw_records, compression_of, open_input
+
+# 关键词候选按块小写后查找，块之间重叠关键词长度减一个字节
+BLOCK_SIZE = 8 * 1024 * 1024
+# 小写后含 ASCII 字母的非 ASCII 字符（İ -> i̇，K -> k）的 UTF-8 编码
+_FOLD_EXCEPTIONS = (b'\xc4\xb0', b'\xe2\x84\xaa')
+
+def _literal_hits(data, start, needle):
+    pos = data.find(needle, start)
+    while pos != -1:
+        yield pos
+        pos = data.find(needle, pos + 1)
+
+def _folded_hits(data, start, needle):
+    """ASCII 忽略大小写查找：bytes.lower() 只改 ASCII 字母、不改长度，块内位置即文件位置"""
+    size = len(data)
+    overlap = len(needle) - 1
+    block_start = start
+    while block_start < size:
+        block_end = min(size, block_start + BLOCK_SIZE)
+        block = data[block_start:min(size, block_end + overlap)].lower()
+        pos = block.find(needle)
+        while pos != -1 and block_start + pos < block_end:
+            yield block_start + pos
+            pos = block.find(needle, pos + 1)
+        block_start = block_end
+
+def keyword_finder(keyword):
+    """关键词（已小写）的候选查找函数；不是纯 ASCII 或包含引号时返回 None，只能逐条解码比较"""
+    if not keyword or not keyword.isascii() or '"' in keyword:
+        return None
+    needle = keyword.encode('ascii')
+
+    def find(data, start):
+        streams = [_folded_hits(data, start, needle), *(_literal_hits(data, start, e) for e in _FOLD_EXCEPTIONS)]
+        return heapq.merge(*streams)
+    return find
+
+def _trie_regex(codes):
+    """把一组 code 编成前缀树形式的正则，共享前缀只比较一次，比平铺的多选一快得多"""
+    root = {}
+    for code in codes:
+        node = root
+        for ch in code:
+            node = node.setdefault(ch, {})
+        node[None] = {}
+
+    def emit(node):
+        parts = [re.escape(ch) + emit(child) for ch, child in sorted((k, v) for k, v in node.items() if k is not None)]
+        if not parts:
+            return ''
+        body = parts[0] if len(parts) == 1 else '(?:' + '|'.join(parts) + ')'
+        if None in node:
+            body = (body if len(parts) > 1 else '(?:' + body + ')') + '?'
+        return body
+    return emit(root)
+
+def category_finder(codes):
+    """类目 code 集合的候选查找函数：前后都是逗号的 code（类目 code 是数字，写出时不会加引号）"""
+    pattern = re.compile((',(?:' + _trie_regex(codes) + ')[,\r\n]').encode('utf-8'))
+
+    def find(data, start):
+        # 用匹配的最后一个字节（分隔符）定位所在记录
+        return (match.end() - 1 for match in pattern.finditer(data, start))
+    return find
+
+def scan_candidates(path, finder, column):
+    """逐条返回 finder 找到的候选位置所在的记录：(第 column 列的字节值, 记录原始字节)，调用方仍需校验列值
+
+    path 必须是未压缩文件，表头行不在返回结果中。
+    """
+    if compression_of(path):
+        raise ValueError(f'压缩文件不能 mmap 扫描: {path}')
+    with open(path, 'rb') as f:
+        header_line = f.readline()
+        size = f.seek(0, 2)
+        if size <= len(header_line):
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            cursor = len(header_line)
+            for hit in finder(data, cursor):
+                if hit < cursor:
+                    continue
+                # 候选位置所在行的行首；中间隔着引号内的换行时继续往前，直到引号个数为偶数
+                start = data.rfind(b'\n', cursor, hit) + 1 or cursor
+                quotes = data[cursor:start].count(b'"')
+                while quotes % 2 and start > cursor:
+                    prev = data.rfind(b'\n', cursor, start - 1) + 1 or cursor
+                    quotes -= data[prev:start].count(b'"')
+                    start = prev
+                # 记录结尾：到行尾，引号未闭合时继续往后补行
+                end = data.find(b'\n', hit) + 1 or size
+                while data[start:end].count(b'"') % 2 and end < size:
+                    end = data.find(b'\n', end) + 1 or size
+                record = data[start:end]
+                cursor = end
+                for value, record in iter_raw_records([record], column):
+                    yield value, record
+        finally:
+            data.close()
+
+def iter_candidate_records(path, column, finder=None):
+    """未压缩文件且有候选查找函数时用 mmap 只取候选记录，否则流式读取全部记录；都不含表头"""
+    if finder is not None and not compression_of(path):
+        yield from scan_candidates(path, finder, column)
+        return
+    with open_input(path) as f:
+        f.readline()
+        yield from iter_raw_records(f, column)
@@ -0,0 +1,183 @@
+"""
+GMC 数据的统一（canonical）表结构
+
+BigQuery 导出（gmc_data.sh）的列是拆开的 price_min / price_max / price_currency / relative_demand_*，
+而 exports/ 下的导出文件是合并后的文本列，例如 price_range="14-14 USD"、relative_demand="51-100 Very high"，
+日期也只有 "2025-07-11"。国家拆分脚本在写分片时用 normalize_row 把两种格式统一成 CANONICAL_HEADER：
+    - rank / previous_rank、需求 min / max 为整数
+    - price_min / price_max 为数字，price_currency 为大写 ISO 代码
+    - 需求档位统一成 DEMAND_BUCKETS 中的写法，可用 demand_level 得到序号（Very low=0 ... Very high=4）
+表头与 CANONICAL_HEADER 一致的文件（BigQuery 导出）已经是这种格式，原样复制，不逐行解析。
+
+报表脚本用 load_rows 读取，读入时一次性转换成 int / float，之后排序和比较不再做字符串清洗。
+"""
+
+import io
+import re
+import sys
+import csv
+
+from gmc_io import open_text
+
+CANONICAL_HEADER = [
+    'rank_timestamp', 'rank', 'previous_rank', 'ranking_country', 'ranking_category', 'product_title', 'brand',
+    'price_min', 'price_max', 'price_currency',
+    'relative_demand_min', 'relative_demand_max', 'relative_demand_bucket',
+    'previous_relative_demand_min', 'previous_relative_demand_max', 'previous_relative_demand_bucket',
+]
+CANONICAL_HEADER_LINE = (','.join(CANONICAL_HEADER) + '\n').encode('utf-8')
+
+INT_FIELDS = ['rank', 'previous_rank', 'relative_demand_min', 'relative_demand_max',
+              'previous_relative_demand_min', 'previous_relative_demand_max']
+FLOAT_FIELDS = ['price_min', 'price_max']
+
+DEMAND_BUCKETS = ['Very low', 'Low', 'Medium', 'High', 'Very high']
+_DEMAND_LEVELS = {bucket.lower(): i for i, bucket in enumerate(DEMAND_BUCKETS)}
+
+CURRENCY_SYMBOLS = {
+    '$': 'USD', '£': 'GBP', '€': 'EUR', '¥': 'JPY', '₹': 'INR', '₽': 'RUB', '₩': 'KRW', '₪': 'ILS',
+    '₦': 'NGN', '₨': 'PKR', '₴': 'UAH', '₸': 'KZT', '₺': 'TRY', '₼': 'AZN', '₾': 'GEL',
+}
+
+# "14-14 USD"、"14.99 USD"、"$14 - $20"
+_RANGE_RE = re.compile(r'^\s*([^\d\s-]*)\s*([\d.,]+)\s*(?:-\s*[^\d\s]*\s*([\d.,]+))?\s*([A-Za-z]{3}|[^\w\s]?)\s*$')
+# "51-100 Very high"
+_DEMAND_RE = re.compile(r'^\s*(\d+)\s*-\s*(\d+)\s+(.+?)\s*$')
+
+def demand_level(bucket):
+    """需求档位的序号，Very low=0 ... Very high=4，无法识别时返回 None"""
+    if not bucket:
+        return None
+    return _DEMAND_LEVELS.get(str(bucket).strip().lower())
+
+def canonical_bucket(bucket):
+    level = demand_level(bucket)
+    return DEMAND_BUCKETS[level] if level is not None else (bucket or '').strip()
+
+def format_number(value):
+    """数字写回 CSV 时的统一格式：整数不带小数点"""
+    if value is None:
+        return ''
+    return f'{value:.15g}'
+
+def _to_int(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return int(float(value.replace(',', '')))
+
+def _to_float(value):
+    value = (value or '').strip().replace(',', '')
+    return float(value) if value else None
+
+def parse_price_range(text):
+    """"14-20 USD" -> (14.0, 20.0, 'USD')，无法解析时返回 (None, None, '')"""
+    match = _RANGE_RE.match(text or '')
+    if not match:
+        return None, None, ''
+    prefix, low, high, suffix = match.groups()
+    currency = suffix.upper() if len(suffix) == 3 else CURRENCY_SYMBOLS.get(suffix or prefix, '')
+    low = _to_float(low)
+    return low, _to_float(high) if high else low, currency
+
+def parse_demand(text):
+    """"51-100 Very high" -> (51, 100, 'Very high')"""
+    match = _DEMAND_RE.match(text or '')
+    if not match:
+        return None, None, canonical_bucket(text)
+    return int(match.group(1)), int(match.group(2)), canonical_bucket(match.group(3))
+
+def canonical_timestamp(value):
+    """只有日期的 rank_timestamp 补成 BigQuery 导出的 "YYYY-MM-DD 00:00:00 UTC" 格式"""
+    value = (value or '').strip()
+    if len(value) == 10 and value[4] == '-' and value[7] == '-':
+        return f'{value} 00:00:00 UTC'
+    return value
+
+def normalize_row(row):
+    """把任一格式的一行（dict）转换成按 CANONICAL_HEADER 排列的字符串列表"""
+    price_min, price_max, currency = None, None, ''
+    if row.get('price_range'):
+        price_min, price_max, currency = parse_price_range(row['price_range'])
+    elif row.get('price_min') or row.get('price_max'):
+        price_min, price_max, currency = parse_price_range(
+            f"{row.get('price_min') or row.get('price_max')}-{row.get('price_max') or row.get('price_min')}"
+            f" {row.get('price_currency') or ''}")
+    currency = currency or (row.get('price_currency') or '').strip().upper()
+
+    demand = {}
+    for prefix in ('relative_demand', 'previous_relative_demand'):
+        if row.get(prefix):
+            demand[prefix] = parse_demand(row[prefix])
+        else:
+            demand[prefix] = (_to_int(row.get(f'{prefix}_min')), _to_int(row.get(f'{prefix}_max')),
+                              canonical_bucket(row.get(f'{prefix}_bucket')))
+
+    title = row.get('product_title') or row.get('product_title_any') or row.get('product_title_en') or ''
+    values = {
+        'rank_timestamp': canonical_timestamp(row.get('rank_timestamp')),
+        'rank': _to_int(row.get('rank')),
+        'previous_rank': _to_int(row.get('previous_rank')),
+        'ranking_country': (row.get('ranking_country') or '').strip().upper(),
+        'ranking_category': (row.get('ranking_category') or '').strip(),
+        'product_title': title,
+        'brand': row.get('brand') or '',
+        'price_min': price_min,
+        'price_max': price_max,
+        'price_currency': currency,
+    }
+    for prefix, (low, high, bucket) in demand.items():
+        values[f'{prefix}_min'] = low
+        values[f'{prefix}_max'] = high
+        values[f'{prefix}_bucket'] = bucket
+    return [format_number(values[col]) if col in FLOAT_FIELDS
+            else ('' if values[col] is None else str(values[col])) for col in CANONICAL_HEADER]
+
+def normalize_record(record, file_header):
+    """非统一格式的一条原始记录（bytes）：解析后用 normalize_row 转换并序列化成 CANONICAL_HEADER 格式"""
+    row = next(csv.reader([record.decode('utf-8')]), [])
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator='\n').writerow(normalize_row(dict(zip(file_header, row))))
+    return buf.getvalue().encode('utf-8')
+
+def _lenient(parse, value):
+    """解析失败的单元格按缺失值处理"""
+    try:
+        return parse(value)
+    except (ValueError, OverflowError):
+        return None
+
+def typed_row(row):
+    """canonical CSV 中读出的一行转换为带类型的 dict：整数列为 int（"1.0" 也按整数解析），价格为 float，
+    缺失或无法解析的值为 None"""
+    for col in INT_FIELDS:
+        row[col] = _lenient(_to_int, row.get(col))
+    for col in FLOAT_FIELDS:
+        row[col] = _lenient(_to_float, row.get(col))
+    return row
+
+def load_rows(csv_path, require_title=True):
+    """读取 canonical CSV（可压缩），返回带类型的行列表；默认跳过没有 product_title 的行"""
+    with open_text(csv_path) as f:
+        return [typed_row(row) for row in csv.DictReader(f) if row.get('product_title') or not require_title]
+
+def rank_key(row):
+    """按 rank 升序排序的键，没有 rank 的行排在最后"""
+    rank = row.get('rank')
+    return rank if rank is not None else sys.maxsize
+
+def price_range(row):
+    """生成价格区间字符串"""
+    if row.get('price_min') is not None and row.get('price_max') is not None and row['price_min'] != row['price_max']:
+        return f"{format_number(row['price_min'])} - {format_number(row['price_max'])} {row.get('price_currency') or ''}"
+    elif row.get('price_min') is not None:
+        return f"{format_number(row['price_min'])} {row.get('price_currency') or ''}"
+    else:
+        return ''
+
+def cell(value):
+    """HTML 表格单元格的值，None 显示为空"""
+    return '' if value is None else value
@@ -0,0 +1,226 @@
+"""
+进程间共享的国家数据
+
+并行拆分同一个国家时，如果每个子进程各自读取国家文件、各建一份 DataFrame，内存会按进程数成倍增加。
+SharedCountry 由父进程只加载、分组一次，子进程只读附加：
+    - 数据：未压缩文件各进程直接 mmap（页缓存本身就在进程间共享）；压缩文件由父进程解压一次放进 SharedMemory
+    - spans：按目标类目分组（组内保持原顺序）的每条记录 [起始, 结束) 字节偏移，numpy int64，放在 SharedMemory
+    - groups：{目标类目: (spans 中的起点, 终点)}，随任务描述一起传给子进程
+子进程各自负责一部分类目，把记录原始字节写到类目文件，内存占用不随进程数增加。
+split_levels 在当前进程内用同样的分组按任意层级范围拆分，每个类目文件一次写完。
+"""
+
+import mmap
+from array import array
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from gmc_io import iter_record_spans, compression_of, is_csv, open_input, open_output, csv_name
+from gmc_manifest import CategoryManifest
+
+def _iter_lines(data, pos):
+    size = len(data)
+    while pos < size:
+        end = data.find(b'\n', pos) + 1 or size
+        yield data[pos:end]
+        pos = end
+
+class SharedCountry:
+    """父进程用 create 创建，子进程用 attach(spec) 附加；用完后各自 close，父进程最后 unlink"""
+
+    def __init__(self, spec, data, segments, file=None):
+        self.spec = spec
+        self.path, self.header_line, _, self.data_size, self.groups, _, count = spec
+        self.data = data
+        self._segments = segments
+        self._file = file
+        self.spans = np.ndarray((count, 2), dtype=np.int64, buffer=segments[-1].buf)
+
+    @classmethod
+    def create(cls, csv_path, route):
+        """加载国家文件并按 route（{行类目: 目标类目}）分组；route 中没有的行不属于任何目标类目"""
+        csv_path = str(csv_path)
+        segments = []
+        if compression_of(csv_path):
+            with open_input(csv_path) as f:
+                source = f.read()
+            data_shm = shared_memory.SharedMemory(create=True, size=max(1, len(source)))
+            data_shm.buf[:len(source)] = source
+            segments.append(data_shm)
+            file = None
+        else:
+            file = open(csv_path, 'rb')
+            source = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if file.seek(0, 2) else b''
+        header_end = source.find(b'\n') + 1 or len(source)
+        header_line = bytes(source[:header_end])
+        category_idx = header_line.decode('utf-8').rstrip('\r\n').split(',').index('ranking_category')
+
+        # 一次扫描，把每条记录的字节区间追加到所属目标类目的数组
+        route = {code.encode('utf-8'): target for code, target in route.items()}
+        spans = {}
+        for category, record, offset in iter_record_spans(_iter_lines(source, header_end), category_idx, header_end):
+            target = route.get(category)
+            if target is not None:
+                target_spans = spans.get(target)
+                if target_spans is None:
+                    target_spans = spans[target] = array('q')
+                target_spans.append(offset)
+                target_spans.append(offset + len(record))
+
+        groups = {}
+        count = 0
+        for target, target_spans in spans.items():
+            groups[target] = (count, count + len(target_spans) // 2)
+            count += len(target_spans) // 2
+        spans_shm = shared_memory.SharedMemory(create=True, size=max(1, count * 16))
+        flat = np.ndarray((count * 2,), dtype=np.int64, buffer=spans_shm.buf)
+        for target, target_spans in spans.items():
+            begin, end = groups[target]
+            flat[begin * 2:end * 2] = np.frombuffer(target_spans, dtype=np.int64)
+        del flat, spans
+        segments.append(spans_shm)
+
+        data_name = segments[0].name if file is None else None
+        spec = (csv_path, header_line, data_name, len(source), groups, spans_shm.name, count)
+        if file is None:
+            del source
+            data = segments[0].buf[:spec[3]]
+        else:
+            data = source
+        return cls(spec, data, segments, file)
+
+    @classmethod
+    def attach(cls, spec):
+        path, _, data_name, data_size, _, spans_name, _ = spec
+        segments = []
+        file = None
+        if data_name is not None:
+            segments.append(shared_memory.SharedMemory(name=data_name))
+            data = segments[0].buf[:data_size]
+        else:
+            file = open(path, 'rb')
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if data_size else b''
+        segments.append(shared_memory.SharedMemory(name=spans_name))
+        return cls(spec, data, segments, file)
+
+    def write(self, target, path, level=None):
+        """把目标类目的记录按原始字节写到 path（先写表头），返回行数"""
+        begin, end = self.groups.get(target, (0, 0))
+        return self._write_spans(self.spans[begin:end], path, level)
+
+    def write_union(self, targets, path, level=None):
+        """把多个目标类目的记录按国家文件中的原顺序合并写到 path，返回行数"""
+        spans = [self.spans[begin:end] for begin, end in (self.groups[t] for t in targets if t in self.groups)]
+        if len(spans) > 1:
+            spans = np.concatenate(spans)
+            spans = [spans[np.argsort(spans[:, 0], kind='stable')]]
+        return self._write_spans(spans[0] if spans else self.spans[0:0], path, level)
+
+    def _write_spans(self, spans, path, level):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open_output(path, 'wb', level) as out:
+            out.write(self.header_line)
+            for start, stop in spans.tolist():
+                record = self.data[start:stop]
+                out.write(record)
+                # 文件最后一条记录可能没有换行
+                if record[-1:] != b'\n':
+                    out.write(b'\n')
+        return len(spans)
+
+    def close(self):
+        del self.spans
+        if isinstance(self.data, memoryview):
+            self.data.release()
+        elif isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = None
+        if self._file is not None:
+            self._file.close()
+        for segment in self._segments:
+            segment.close()
+
+    def unlink(self):
+        for segment in self._segments:
+            segment.unlink()
+
+def write_categories(spec, jobs, level=None):
+    """子进程任务：jobs 为 [(目标类目, 输出文件)]，返回 {目标类目: 行数}"""
+    shared = SharedCountry.attach(spec)
+    try:
+        return {target: shared.write(target, path, level) for target, path in jobs}
+    finally:
+        shared.close()
+
+def split_levels(csv_path, country_dir, taxonomy, low, high, compress=None, compress_level=None):
+    """在当前进程内把一个国家文件按 low~high 级类目拆分，每个输出文件只打开、写入一次
+
+    先按行的原始类目分组一次，每个输出文件取其子树中各原始类目的记录按原顺序合并写出，
+    压缩输出不会因为句柄被淘汰后追加而变成多个 gzip member / zstd frame。
+    只写有数据的类目，返回 {输出文件: (层级, 类目, 行数)}。
+    """
+    country = country_dir.name
+    shared = SharedCountry.create(csv_path, {code: code for code in taxonomy.order})
+    try:
+        members = {}
+        for code in shared.groups:
+            chain = taxonomy.path[code]
+            for level in range(low, min(high, len(chain)) + 1):
+                members.setdefault((level, chain[level - 1]), []).append(code)
+        results = {}
+        for (level, code), codes in members.items():
+            path = country_dir.joinpath(*taxonomy.path[code]) / csv_name(f"{code}_{country}", compress)
+            results[path] = (level, code, shared.write_union(codes, path, compress_level))
+        return results
+    finally:
+        shared.close()
+        shared.unlink()
+
+def _balance(jobs, sizes, buckets):
+    """按行数把任务分成 buckets 份：从大到小依次放进当前最轻的一份"""
+    loads = [[0, []] for _ in range(buckets)]
+    for job in sorted(jobs, key=lambda job: sizes.get(job[0], 0), reverse=True):
+        lightest = min(loads, key=lambda load: load[0])
+        lightest[0] += sizes.get(job[0], 0) + 1
+        lightest[1].append(job)
+    return [bucket for _, bucket in loads if bucket]
+
+def split_country_shared(country_dir, taxonomy, level, args, pool=None):
+    """按第 level 级类目拆分一个国家目录：父进程加载、分组一次，pool 中的 args.workers 个子进程各写一部分类目
+
+    pool 为 None 时在主进程内写出。返回生成的文件数。sparse 时只写有数据的类目并删除以前留下的同名文件。
+    """
+    country = country_dir.name
+    csv_files = [f for f in country_dir.iterdir() if f.is_file() and is_csv(f)]
+    manifest = CategoryManifest.load(country_dir)
+    manifest.reset(level)
+    written = 0
+    for csv_file in csv_files:
+        shared = SharedCountry.create(csv_file, taxonomy.level_map(level))
+        try:
+            jobs = []
+            for code in taxonomy.codes_at_depth(level):
+                path = country_dir.joinpath(*taxonomy.path[code]) / csv_name(f"{code}_{country}", args.compress)
+                if args.sparse and code not in shared.groups:
+                    path.unlink(missing_ok=True)
+                    continue
+                jobs.append((code, path))
+            sizes = {code: end - begin for code, (begin, end) in shared.groups.items()}
+            paths = dict(jobs)
+            if pool is None:
+                results = [write_categories(shared.spec, jobs, args.compress_level)]
+            else:
+                futures = [pool.submit(write_categories, shared.spec, bucket, args.compress_level)
+                           for bucket in _balance(jobs, sizes, args.workers)]
+                results = [future.result() for future in futures]
+            for counts in results:
+                for code, rows in counts.items():
+                    manifest.record(level, code, paths[code], rows)
+            written += len(jobs)
+            print(f"处理 {country}/{csv_file.name} 完成: {len(shared.groups)} 个有数据的类目，共写出 {len(jobs)} 个文件")
+        finally:
+            shared.close()
+            shared.unlink()
+    manifest.save()
+    return written
@@ -0,0 +1,140 @@
+"""
+类目树索引（public/categories.json）
+
+categories.json 是嵌套的类目树，拆分脚本以前对每个输出类目递归收集一次全部子类目 code，
+再逐行判断是否在集合中。Taxonomy 在加载时按前序遍历把整棵树展开成平铺的表：
+    - order[i]        第 i 个类目的 code（前序）
+    - index[code]     code 在 order 中的位置，子树占据 [index, end) 连续区间
+    - path[code]      从一级类目到自身的 code 元组，如 ('1', '2', '3237')
+    - parent[code]    父类目 code，一级类目为 None
+    - name[code]      catalog_name
+一行数据用 path 查一次字典即可知道它属于哪个一级/二级/三级类目。
+
+展开后的表会以 pickle 缓存到 scripts/__pycache__/taxonomy.pickle，缓存里记下 categories.json 的
+路径、大小和修改时间，文件没有变化时直接加载缓存，不再解析 JSON 和遍历树。
+"""
+
+import os
+import json
+import hashlib
+import pickle
+from pathlib import Path
+
+CATEGORIES_PATH = Path(__file__).parent.parent / 'public' / 'categories.json'
+CACHE_PATH = Path(__file__).parent / '__pycache__' / 'taxonomy.pickle'
+# 展开表的结构变化时递增，旧缓存自动失效
+CACHE_VERSION = 1
+_TABLES = ('order', 'index', 'end', 'path', 'parent', 'name', 'full_name')
+
+def _source_key(path):
+    st = os.stat(path)
+    return (CACHE_VERSION, str(Path(path).resolve()), st.st_size, st.st_mtime_ns)
+
+class Taxonomy:
+    def __init__(self, roots):
+        self.order = []
+        self.index = {}
+        self.end = {}
+        self.path = {}
+        self.parent = {}
+        self.name = {}
+        self.full_name = {}
+        stack = [(node, ()) for node in reversed(roots)]
+        # 先序遍历；子树结束位置在弹出哨兵时记录
+        while stack:
+            node, prefix = stack.pop()
+            if node is None:
+                self.end[prefix] = len(self.order)
+                continue
+            code = str(node['code'])
+            self.index[code] = len(self.order)
+            self.order.append(code)
+            self.path[code] = prefix + (code,)
+            self.parent[code] = prefix[-1] if prefix else None
+            self.name[code] = node.get('catalog_name', '')
+            self.full_name[code] = node.get('full_catalog_name', '')
+            stack.append((None, code))
+            for child in reversed(node.get('children') or []):
+                stack.append((child, self.path[code]))
+
+    @classmethod
+    def _from_tables(cls, tables):
+        taxonomy = cls.__new__(cls)
+        for attr in _TABLES:
+            setattr(taxonomy, attr, tables[attr])
+        return taxonomy
+
+    @classmethod
+    def load(cls, path=CATEGORIES_PATH, cache_path=CACHE_PATH):
+        """加载类目树；categories.json 未变化时直接读取缓存，cache_path=None 时不使用缓存"""
+        key = _source_key(path)
+        if cache_path is not None:
+            try:
+                with open(cache_path, 'rb') as f:
+                    cached = pickle.load(f)
+                if cached.get('key') == key:
+                    return cls._from_tables(cached['tables'])
+            except (OSError, EOFError, pickle.UnpicklingError, AttributeError, KeyError, TypeError):
+                pass
+        with open(path, 'r', encoding='utf-8') as f:
+            taxonomy = cls(json.load(f))
+        if cache_path is not None:
+            taxonomy._save_cache(cache_path, key)
+        return taxonomy
+
+    def _save_cache(self, cache_path, key):
+        """先写临时文件再替换，并发运行的脚本不会读到写了一半的缓存；写不进去时忽略"""
+        cache_path = Path(cache_path)
+        tmp = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                pickle.dump({'key': key, 'tables': {attr: getattr(self, attr) for attr in _TABLES}},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache_path)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+
+    def digest(self):
+        """类目树结构（前序的 code 及各自子树的结束位置）的摘要；摘要相同的两棵树排序位置和子树范围都相同"""
+        h = hashlib.sha1()
+        for code in self.order:
+            h.update(f'{code}:{self.end[code]}\n'.encode('utf-8'))
+        return h.hexdigest()
+
+    def __contains__(self, code):
+        return code in self.index
+
+    def depth(self, code):
+        """类目层级，一级类目为 1；未知 code 返回 0"""
+        return len(self.path.get(code, ()))
+
+    def descendants(self, code):
+        """code 自身及全部子孙类目的 code 列表（前序）"""
+        if code not in self.index:
+            return [code]
+        return self.order[self.index[code]:self.end[code]]
+
+    def ancestor(self, code, level):
+        """code 在第 level 级的祖先（level 等于自身层级时返回自身），层级不够时返回 None"""
+        path = self.path.get(code)
+        if path is None or len(path) < level:
+            return None
+        return path[level - 1]
+
+    def route(self, code, levels):
+        """行的类目 code -> 需要写入的各级类目 code，最多 levels 级"""
+        return self.path.get(code, ())[:levels]
+
+    def level_map(self, level):
+        """{code: 第 level 级祖先}，只包含层级不低于 level 的类目，可直接交给 pandas Series.map"""
+        return {code: path[level - 1] for code, path in self.path.items() if len(path) >= level}
+
+    def codes_at_depth(self, depth):
+        """第 depth 级的全部类目 code（前序）"""
+        return [code for code in self.order if len(self.path[code]) == depth]
+
+    def children(self, code):
+        """直接子类目 code 列表"""
+        depth = self.depth(code) + 1
+        return [c for c in self.descendants(code) if len(self.path[c]) == depth]
@@ -0,0 +1,269 @@
+"""
+product_title 倒排索引
+
+关键词提取要对整个国家文件做忽略大小写的子串查找，数据量大时一次查询要扫描很久。
+build_title_index 为国家 CSV 生成旁路索引目录 <国家文件>.titleidx/：
+    - vocab.txt / vocab_offsets.npy：标题小写后按 \\w+ 切出的词，排序后以换行分隔，及每个词的起始位置
+    - postings.npy / pointers.npy：每个词出现的行号（uint32，升序），词 i 的行号为 postings[pointers[i]:pointers[i + 1]]
+    - starts.npy / ends.npy：每行记录在国家文件中的 [起始, 结束) 字节（记录之间可能夹着空行）
+    - trigrams.npy / trigram_pointers.npy / trigram_postings.npy：归一化标题（小写后只保留词字符）的三字符片段及其行号，
+      供模糊查询使用
+    - meta.json：国家文件的大小和修改时间，文件被重新生成后索引自动失效，读取方回退到全量扫描；
+      生成国家文件的脚本改写文件后用 refresh_title_index 重建已有的索引
+
+查询仍是原来的子串语义：关键词（小写）的每个词一定落在标题的某个词里——
+两侧都连着关键词开头/结尾的词只需是子串，一侧挨着非词字符的词必须是前缀/后缀，两侧都挨着的词必须完全相同。
+在词表中找出满足条件的词、合并各自的行号再求交集，得到候选行，只读取候选记录用原规则校验。
+
+模糊查询：相似度为查询的三字符片段中出现在标题里的比例（都先归一化，"earbud" 与 "ear buds" 相似度为 1，
+"headphnoes" 与 "headphones" 为 0.5）。按各片段的行号统计每行命中的片段数，达到阈值的行为候选，
+再读取候选记录按标题重新计算相似度确认。归一化后不足三个字符的查询按归一化后的子串判断。
+只支持未压缩的国家文件（按字节偏移读取记录）。需要 numpy（随 pandas 安装）。
+"""
+
+import os
+import re
+import math
+import csv
+import json
+import mmap
+import shutil
+from array import array
+from pathlib import Path
+
+from gmc_io import iter_raw_records, iter_record_spans, compression_of
+
+INDEX_SUFFIX = '.titleidx'
+# 索引文件格式变化时递增，旧格式的索引视为过期（3：增加 ends，之前的版本遇到空行会错位）
+INDEX_VERSION = 3
+TOKEN_RE = re.compile(r'\w+')
+DEFAULT_FUZZY_THRESHOLD = 0.5
+
+def index_dir(csv_path):
+    csv_path = Path(csv_path)
+    return csv_path.with_name(csv_path.name + INDEX_SUFFIX)
+
+def tokenize(text):
+    """与查询一致的切词：小写后的 \\w+ 连续片段"""
+    return TOKEN_RE.findall(text.lower())
+
+def normalize_title(text):
+    """模糊匹配用的归一化：小写后只保留词字符，去掉空格和标点"""
+    return ''.join(tokenize(text))
+
+def trigrams(normalized):
+    return {normalized[i:i + 3] for i in range(len(normalized) - 2)}
+
+def fuzzy_similarity(query, title):
+    """query 为归一化后的查询；返回 0~1 的相似度"""
+    normalized = normalize_title(title)
+    query_grams = trigrams(query)
+    if not query_grams:
+        return 1.0 if query in normalized else 0.0
+    return len(query_grams & trigrams(normalized)) / len(query_grams)
+
+def _postings(vocab, term_ids, row_ids):
+    """(排序后的词表, pointers, postings)：词按字典序编号，每个词的行号保持升序"""
+    import numpy as np
+
+    terms = sorted(vocab)
+    rank = np.empty(len(terms), dtype=np.int64)
+    rank[[vocab[term] for term in terms]] = np.arange(len(terms))
+    keys = rank[np.frombuffer(term_ids, dtype=np.int64)]
+    order = np.argsort(keys, kind='stable')
+    postings = np.frombuffer(row_ids, dtype=np.int64)[order].astype(np.uint32)
+    pointers = np.searchsorted(keys[order], np.arange(len(terms) + 1)).astype(np.int64)
+    return terms, pointers, postings
+
+def build_title_index(csv_path):
+    """为国家文件生成标题倒排索引，返回索引目录；压缩文件不处理，返回 None"""
+    import numpy as np
+
+    csv_path = Path(csv_path)
+    if compression_of(csv_path):
+        return None
+    vocab = {}
+    token_ids = array('q')
+    row_ids = array('q')
+    gram_vocab = {}
+    gram_ids = array('q')
+    gram_rows = array('q')
+    starts = array('q')
+    ends = array('q')
+    with open(csv_path, 'rb') as f:
+        header_line = f.readline()
+        title_idx = next(csv.reader([header_line.decode('utf-8')])).index('product_title')
+        for row, (title, record, start) in enumerate(iter_record_spans(f, title_idx, len(header_line))):
+            starts.append(start)
+            ends.append(start + len(record))
+            title_tokens = tokenize(title.decode('utf-8'))
+            for token in set(title_tokens):
+                token_id = vocab.get(token)
+                if token_id is None:
+                    token_id = vocab[token] = len(vocab)
+                token_ids.append(token_id)
+                row_ids.append(row)
+            for gram in trigrams(''.join(title_tokens)):
+                gram_id = gram_vocab.get(gram)
+                if gram_id is None:
+                    gram_id = gram_vocab[gram] = len(gram_vocab)
+                gram_ids.append(gram_id)
+                gram_rows.append(row)
+
+    tokens, pointers, postings = _postings(vocab, token_ids, row_ids)
+    vocab_offsets = np.cumsum([0] + [len(token) + 1 for token in tokens], dtype=np.int64)[:-1] + 1
+    grams, gram_pointers, gram_postings = _postings(gram_vocab, gram_ids, gram_rows)
+
+    # 写到临时目录后整体替换
+    path = index_dir(csv_path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir()
+    with open(tmp_path / 'vocab.txt', 'w', encoding='utf-8', newline='') as f:
+        f.write('\n' + ''.join(token + '\n' for token in tokens))
+    np.save(tmp_path / 'vocab_offsets.npy', vocab_offsets)
+    np.save(tmp_path / 'pointers.npy', pointers)
+    np.save(tmp_path / 'postings.npy', postings)
+    np.save(tmp_path / 'starts.npy', np.frombuffer(starts, dtype=np.int64))
+    np.save(tmp_path / 'ends.npy', np.frombuffer(ends, dtype=np.int64))
+    np.save(tmp_path / 'trigrams.npy', np.array(grams, dtype='<U3'))
+    np.save(tmp_path / 'trigram_pointers.npy', gram_pointers)
+    np.save(tmp_path / 'trigram_postings.npy', gram_postings)
+    st = os.stat(csv_path)
+    meta = {'version': INDEX_VERSION, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'rows': len(starts),
+            'tokens': len(tokens), 'trigrams': len(grams)}
+    with open(tmp_path / 'meta.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    old_path = path.with_name(path.name + '.old')
+    if path.exists():
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return path
+
+def refresh_title_index(csv_path, build=False):
+    """国家文件被改写或删除后调用：build 为真或已有索引时，索引过期则重建，返回索引目录；
+    国家文件已不存在或是压缩文件（无法建索引）时删除旧索引，返回 None"""
+    path = index_dir(csv_path)
+    if not (build or path.exists()):
+        return None
+    if not Path(csv_path).exists() or compression_of(csv_path):
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+    if TitleIndex.open(csv_path) is not None:
+        return path
+    return build_title_index(csv_path)
+
+class TitleIndex:
+    """只读打开的标题索引，行号、指针等数组以 mmap 方式加载"""
+
+    def __init__(self, csv_path, path):
+        import numpy as np
+
+        self.csv_path = Path(csv_path)
+        with open(path / 'vocab.txt', 'r', encoding='utf-8', newline='') as f:
+            self.vocab = f.read()
+        self.vocab_offsets = np.load(path / 'vocab_offsets.npy', mmap_mode='r')
+        self.pointers = np.load(path / 'pointers.npy', mmap_mode='r')
+        self.postings = np.load(path / 'postings.npy', mmap_mode='r')
+        self.starts = np.load(path / 'starts.npy', mmap_mode='r')
+        self.ends = np.load(path / 'ends.npy', mmap_mode='r')
+        self.trigrams = np.load(path / 'trigrams.npy', mmap_mode='r')
+        self.trigram_pointers = np.load(path / 'trigram_pointers.npy', mmap_mode='r')
+        self.trigram_postings = np.load(path / 'trigram_postings.npy', mmap_mode='r')
+        self.rows = len(self.starts)
+
+    @classmethod
+    def open(cls, csv_path):
+        """打开国家文件的标题索引；索引不存在或国家文件已变化时返回 None"""
+        path = index_dir(csv_path)
+        if compression_of(csv_path) or not (path / 'meta.json').exists():
+            return None
+        with open(path / 'meta.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        st = os.stat(csv_path)
+        if (meta.get('version'), meta.get('size'), meta.get('mtime_ns')) != (INDEX_VERSION, st.st_size, st.st_mtime_ns):
+            return None
+        return cls(csv_path, path)
+
+    def _token_ids(self, token, left_open, right_open):
+        """词表中可能包含关键词这一词的词编号：left_open/right_open 表示这个词在关键词中向左/右没有边界"""
+        import numpy as np
+
+        needle = ('' if left_open else '\n') + token + ('' if right_open else '\n')
+        shift = 0 if left_open else 1
+        hits = []
+        pos = self.vocab.find(needle)
+        while pos != -1:
+            hits.append(pos + shift)
+            pos = self.vocab.find(needle, pos + 1)
+        return np.unique(np.searchsorted(self.vocab_offsets, hits, side='right') - 1)
+
+    def candidates(self, keyword):
+        """关键词（已小写）可能命中的行号（升序）；关键词不含任何词字符时无法用索引，返回 None"""
+        import numpy as np
+
+        matches = list(TOKEN_RE.finditer(keyword))
+        if not matches:
+            return None
+        rows = None
+        for match in matches:
+            ids = self._token_ids(match.group(), match.start() == 0, match.end() == len(keyword))
+            token_rows = np.unique(np.concatenate(
+                [self.postings[self.pointers[i]:self.pointers[i + 1]] for i in ids.tolist()] or
+                [np.empty(0, dtype=np.uint32)]))
+            rows = token_rows if rows is None else np.intersect1d(rows, token_rows, assume_unique=True)
+            if not len(rows):
+                break
+        return rows
+
+    def fuzzy_candidates(self, query, threshold):
+        """归一化后的查询可能达到相似度阈值的行号（升序）；查询不足三个字符时无法用索引，返回 None"""
+        import numpy as np
+
+        query_grams = sorted(trigrams(query))
+        if not query_grams:
+            return None
+        hits = []
+        for gram in query_grams:
+            i = int(np.searchsorted(self.trigrams, gram))
+            if i < len(self.trigrams) and self.trigrams[i] == gram:
+                hits.append(self.trigram_postings[self.trigram_pointers[i]:self.trigram_pointers[i + 1]])
+        required = max(1, math.ceil(threshold * len(query_grams) - 1e-9))
+        if len(hits) < required:
+            return np.empty(0, dtype=np.int64)
+        # 每行命中的片段数：同一行在一个片段的行号中只出现一次
+        counts = np.bincount(np.concatenate(hits), minlength=self.rows)
+        return np.flatnonzero(counts >= required)
+
+    def iter_records(self, rows, column):
+        """按行号读取记录：(第 column 列的字节值, 记录原始字节)，顺序与国家文件一致"""
+        if not len(rows):
+            return
+        with open(self.csv_path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for row in rows.tolist():
+                    yield from iter_raw_records([data[self.starts[row]:self.ends[row]]], column)
+            finally:
+                data.close()
+
+def iter_indexed_records(csv_path, column, keyword):
+    """有有效索引且关键词可用索引时返回候选记录的迭代器（调用方仍需校验），否则返回 None"""
+    index = TitleIndex.open(csv_path)
+    if index is None:
+        return None
+    rows = index.candidates(keyword)
+    if rows is None:
+        return None
+    return index.iter_records(rows, column)
+
+def iter_fuzzy_records(csv_path, column, query, threshold=DEFAULT_FUZZY_THRESHOLD):
+    """模糊查询的候选记录迭代器（调用方用 fuzzy_similarity 确认）；没有有效索引或查询过短时返回 None"""
+    index = TitleIndex.open(csv_path)
+    if index is None:
+        return None
+    rows = index.fuzzy_candidates(query, threshold)
+    if rows is None:
+        return None
+    return index.iter_records(rows, column)
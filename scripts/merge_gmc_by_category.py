@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# merge_gmc_by_category.py
+# 用法：python merge_gmc_by_category.py [国家代码] [--depth 1-5] [--sparse] [--workers N] [--memory-budget MB] [--compress gz|zst] [--compress-level N]
+# 示例：python merge_gmc_by_category.py US --depth 1-5
+# 通用类目拆分：每个国家文件只扫描一次，按行的类目分组后，--depth 范围内每个类目文件取其子树的记录一次写完。
+# 目录结构与 merge_gmc_by_category_one.py / _two_python.py / _three_python.py 相同：
+#   output/<国家>/<一级>/<二级>/.../<N级>/<N级>_<国家>.csv
+# 拆分更深的层级只是多写几个文件，不会增加扫描次数；每个输出文件只打开一次，压缩输出是单个 gzip member / zstd frame。
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+from gmc_io import read_header_line, is_csv, csv_name, open_output, add_compression_args
+from gmc_taxonomy import Taxonomy
+from gmc_manifest import CategoryManifest
+from gmc_parallel import add_parallel_args, run_budgeted, estimate_grouped_mb
+from gmc_shared import split_levels
+
+def parse_depth(text):
+    """'3' -> (3, 3)，'1-5' -> (1, 5)"""
+    try:
+        low, _, high = text.partition('-')
+        low = int(low)
+        high = int(high) if high else low
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'无效的层级范围: {text}，应为 N 或 N-M')
+    if not 1 <= low <= high:
+        raise argparse.ArgumentTypeError(f'无效的层级范围: {text}，层级从 1 开始且起始不大于结束')
+    return low, high
+
+def split_country(country_dir: Path, taxonomy: Taxonomy, args):
+    """按 depth 范围内的各级类目拆分一个国家目录下的国家文件并更新类目清单，返回生成的文件数；可在进程池中运行"""
+    country = country_dir.name
+    low, high = args.depth
+    country_start_time = time.time()
+    csv_files = [f for f in country_dir.iterdir() if f.is_file() and is_csv(f)]
+    manifest = CategoryManifest.load(country_dir)
+    for level in range(low, high + 1):
+        manifest.reset(level)
+    written = 0
+    for csv_file in csv_files:
+        results = split_levels(csv_file, country_dir, taxonomy, low, high, args.compress, args.compress_level)
+        for path, (level, code, count) in results.items():
+            manifest.record(level, code, path, count)
+        header_line = read_header_line(csv_file)
+        empty = 0
+        # 与逐级拆分脚本一致：没有数据的类目也生成只有表头的文件；稀疏模式下删除以前运行留下的同名文件
+        for code in taxonomy.order:
+            chain = taxonomy.path[code]
+            if not low <= len(chain) <= high:
+                continue
+            path = country_dir.joinpath(*chain) / csv_name(f'{code}_{country}', args.compress)
+            if path in results:
+                continue
+            if args.sparse:
+                path.unlink(missing_ok=True)
+                continue
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open_output(path, 'wb', args.compress_level) as out:
+                out.write(header_line)
+            manifest.record(len(chain), code, path, 0)
+            empty += 1
+        written += len(results) + empty
+        print(f"处理 {country}/{csv_file.name} 完成: {len(results)} 个有数据的类目文件，{empty} 个空类目文件")
+    manifest.save()
+    print(f"处理国家 {country} 完成，用时: {time.time() - country_start_time:.2f} 秒")
+    return written
+
+def main():
+    start_time = time.time()
+    parser = argparse.ArgumentParser(description='一次扫描按任意层级范围拆分国家数据')
+    parser.add_argument('country', nargs='?', type=str, help='国家代码，如 US。不指定则处理全部国家')
+    parser.add_argument('--depth', type=parse_depth, default=(1, 3),
+                        help='要生成的类目层级范围，如 3 或 1-5，默认 1-3')
+    parser.add_argument('--sparse', action='store_true',
+                        help='只生成有数据的类目文件，不再为没有数据的类目写只有表头的文件；'
+                             '每个国家目录下的 .category_manifest.json 记录各类目的文件和行数')
+    add_compression_args(parser)
+    add_parallel_args(parser)
+    args = parser.parse_args()
+
+    taxonomy = Taxonomy.load()
+    output_root = Path(__file__).parent.parent / 'gmc_data' / 'output'
+    country_dirs = [d for d in output_root.iterdir() if d.is_dir()]
+    if args.country:
+        country_dirs = [d for d in country_dirs if d.name == args.country]
+        if not country_dirs:
+            print(f"错误：找不到国家目录 {args.country}")
+            sys.exit(1)
+
+    low, high = args.depth
+    print(f"开始处理{('国家 ' + args.country) if args.country else '所有国家'}，类目层级: {low}-{high}...")
+    # 每个国家的内存占用按国家文件大小估算（记录偏移，压缩文件还要放下解压后的数据），并行时大的国家先开始
+    jobs = [(estimate_grouped_mb([f for f in d.iterdir() if f.is_file() and is_csv(f)]), (d, taxonomy, args))
+            for d in country_dirs]
+    total_files = sum(run_budgeted(split_country, jobs, args.workers, args.memory_budget))
+    total_duration = time.time() - start_time
+    print(f"全部国家处理完成，共生成 {total_files} 个类目文件，总用时: {total_duration:.2f} 秒")
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,133 @@
-import os
-import json
 import csv
-import sys
 import argparse
 from pathlib import Path
 
-def collect_all_codes(category):
-    """递归收集所有子类目 code"""
-    codes = [category['code']]
-    if category.get('children') and len(category['children']) > 0:
-        for child in category['children']:
-            codes.extend(collect_all_codes(child))
-    return codes
+from gmc_io import iter_raw_records, is_csv, csv_name, open_input, open_output, add_compression_args
+from gmc_taxonomy import Taxonomy
+from gmc_manifest import CategoryManifest
+from gmc_parallel import add_parallel_args, run_budgeted, STREAM_MB
+
+def split_single_pass(csv_path, country_dir, country, taxonomy, top_categories, compress=None, compress_level=None,
+                      sparse=False):
+    """只扫描一次国家文件：每个一级类目一个输出句柄，每行查一次字典找到所属一级类目后原样写出
+
+    返回 {一级类目: (输出文件, 行数)}；稀疏模式下只在类目第一次命中时创建文件，没有数据的类目不出现在结果中。
+    """
+    route = {code.encode('utf-8'): top.encode('utf-8') for code, top in taxonomy.level_map(1).items()}
+    paths = {cat_code: country_dir / cat_code / csv_name(f"{cat_code}_{country}", compress) for cat_code in top_categories}
+    outputs = {}
+    counts = {}
+
+    def open_category(cat_code):
+        out_dir = country_dir / cat_code
+        out_dir.mkdir(parents=True, exist_ok=True)
+        out_f = open_output(paths[cat_code], 'wb', compress_level)
+        out_f.write(header_line)
+        outputs[cat_code.encode('utf-8')] = out_f
+        counts[cat_code] = 0
+        return out_f
+
+    try:
+        with open_input(csv_path) as f:
+            header_line = f.readline()
+            category_idx = next(csv.reader([header_line.decode('utf-8')])).index('ranking_category')
+            if not sparse:
+                # 没有数据的一级类目也生成只有表头的文件
+                for cat_code in top_categories:
+                    open_category(cat_code)
+            for category, record in iter_raw_records(f, category_idx):
+                top = route.get(category)
+                if top is not None:
+                    out_f = outputs.get(top)
+                    if out_f is None:
+                        out_f = open_category(top.decode('utf-8'))
+                    out_f.write(record)
+                    counts[top.decode('utf-8')] += 1
+    finally:
+        for out_f in outputs.values():
+            out_f.close()
+    results = {}
+    for cat_code in top_categories:
+        if cat_code in counts:
+            print(f"    已生成: {paths[cat_code]} ({counts[cat_code]} 条)")
+            results[cat_code] = (paths[cat_code], counts[cat_code])
+        else:
+            # 稀疏模式：删掉以前运行留下的同名文件
+            paths[cat_code].unlink(missing_ok=True)
+    return results
+
+def split_country(country_dir, taxonomy, top_categories, args):
+    """按一级类目拆分一个国家目录下的国家文件并更新类目清单，返回生成的文件数；可在进程池中运行"""
+    print(f"\n处理国家: {country_dir.name}")
+    total_files_processed = 0
+    
+    # 直接查找国家目录下的CSV文件
+    csv_files = [f for f in country_dir.iterdir() if f.is_file() and is_csv(f)]
+    print(f"  找到CSV文件: {[f.name for f in csv_files]}")
+    manifest = CategoryManifest.load(country_dir)
+    manifest.reset(1)
+    
+    for csv_file in csv_files:
+        print(f"  处理文件: {csv_file.name}")
+        csv_path = country_dir / csv_file.name
+        
+        if args.mode == 'single':
+            results = split_single_pass(csv_path, country_dir, country_dir.name, taxonomy, top_categories,
+                                        args.compress, args.compress_level, args.sparse)
+            for cat_code, (out_file, count) in results.items():
+                manifest.record(1, cat_code, out_file, count)
+            total_files_processed += len(results)
+            continue
+        
+        # 为每个一级类目创建对应的输出
+        for cat_code in top_categories:
+            print(f"    处理类目: {cat_code}")
+            
+            all_codes = set(taxonomy.descendants(cat_code))
+            print(f"    类目 {cat_code} 包含的所有code: {list(all_codes)[:5]}...")  # 只显示前5个
+            
+            # 创建输出目录
+            out_dir = country_dir / cat_code
+            out_dir.mkdir(parents=True, exist_ok=True)
+            out_file = out_dir / csv_name(f"{cat_code}_{country_dir.name}", args.compress)
+            
+            # 按原始字节流式筛选：只取 ranking_category 列比较，命中的记录原样写出
+            codes = {code.encode('utf-8') for code in all_codes}
+            count = 0
+            with open_input(csv_path) as f, open_output(out_file, 'wb', args.compress_level) as out_f:
+                header_line = f.readline()
+                out_f.write(header_line)
+                category_idx = next(csv.reader([header_line.decode('utf-8')])).index('ranking_category')
+                for category, record in iter_raw_records(f, category_idx):
+                    if category in codes:
+                        out_f.write(record)
+                        count += 1
+            
+            if args.sparse and count == 0:
+                # 稀疏模式：整个文件扫描完才知道是否为空，空文件生成后再删掉
+                out_file.unlink()
+                print(f"    类目 {cat_code} 没有数据，已跳过")
+                continue
+            print(f"    已生成: {out_file} ({count} 条)")
+            manifest.record(1, cat_code, out_file, count)
+            total_files_processed += 1
+    
+    manifest.save()
+    return total_files_processed
 
 def main():
     # 解析命令行参数
     parser = argparse.ArgumentParser(description='按类目处理GMC数据')
     parser.add_argument('country', nargs='?', type=str, 
                        help='指定国家代码，如 US, AE 等。不指定则处理全部国家')
+    parser.add_argument('--mode', choices=['single', 'rescan'], default='single',
+                        help='single: 每个国家文件只扫描一次，按一级类目同时写出（默认）；'
+                             'rescan: 每个一级类目各扫描一次国家文件')
+    parser.add_argument('--sparse', action='store_true',
+                        help='只生成有数据的类目文件，不再为没有数据的类目写只有表头的文件；'
+                             '每个国家目录下的 .category_manifest.json 记录各类目的文件和行数')
+    add_compression_args(parser)
+    add_parallel_args(parser)
     args = parser.parse_args()
     
     print("--- 开始运行 merge_gmc_by_category_one.py ---")
@@ -31,11 +141,10 @@ def main():
     print(f"Categories path: {categories_path}")
     print(f"Categories file exists: {categories_path.exists()}")
     
-    with open(categories_path, 'r', encoding='utf-8') as f:
-        categories = json.load(f)
+    taxonomy = Taxonomy.load(categories_path)
     
-    # 找到所有 catalog_depth=1 的一级类目
-    top_categories = [cat for cat in categories if cat['catalog_depth'] == '1']
+    # 找到所有一级类目
+    top_categories = taxonomy.codes_at_depth(1)
     print(f"Top categories count: {len(top_categories)}")
     
     output_root = Path(__file__).parent.parent / 'gmc_data' / 'output'
@@ -63,54 +172,12 @@ def main():
     else:
         print(f"将处理全部国家: {[d.name for d in country_dirs]}")
     
-    total_files_processed = 0
-    
-    for country in country_dirs:
-        print(f"\n处理国家: {country.name}")
-        country_dir = output_root / country.name
-        
-        # 直接查找国家目录下的CSV文件
-        csv_files = [f for f in country_dir.iterdir() if f.suffix == '.csv']
-        print(f"  找到CSV文件: {[f.name for f in csv_files]}")
-        
-        for csv_file in csv_files:
-            print(f"  处理文件: {csv_file.name}")
-            csv_path = country_dir / csv_file.name
-            
-            # 为每个一级类目创建对应的输出
-            for cat in top_categories:
-                cat_code = cat['code']
-                print(f"    处理类目: {cat_code}")
-                
-                all_codes = set(collect_all_codes(cat))
-                print(f"    类目 {cat_code} 包含的所有code: {list(all_codes)[:5]}...")  # 只显示前5个
-                
-                # 创建输出目录
-                out_dir = country_dir / cat_code
-                out_dir.mkdir(parents=True, exist_ok=True)
-                out_file = out_dir / f"{cat_code}_{country.name}.csv"
-                
-                # 先写表头
-                with open(csv_path, 'r', encoding='utf-8') as f:
-                    first_line = f.readline().strip()
-                
-                with open(out_file, 'w', encoding='utf-8', newline='') as f:
-                    f.write(first_line + '\n')
-                
-                # 流式读取和筛选
-                count = 0
-                with open(csv_path, 'r', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    with open(out_file, 'a', encoding='utf-8', newline='') as out_f:
-                        writer = csv.DictWriter(out_f, fieldnames=reader.fieldnames)
-                        
-                        for row in reader:
-                            if row['ranking_category'] in all_codes:
-                                writer.writerow(row)
-                                count += 1
-                
-                print(f"    已生成: {out_file} ({count} 条)")
-                total_files_processed += 1
+    # 流式处理不建 DataFrame，每个国家按固定内存估算；并行时大的国家先开始
+    if args.workers > 1:
+        country_dirs.sort(key=lambda d: sum(f.stat().st_size for f in d.iterdir() if f.is_file() and is_csv(f)),
+                          reverse=True)
+    jobs = [(STREAM_MB, (country_dir, taxonomy, top_categories, args)) for country_dir in country_dirs]
+    total_files_processed = sum(run_budgeted(split_country, jobs, args.workers, args.memory_budget))
     
     print(f"\n处理完成！总共处理了 {total_files_processed} 个文件。")
 
@@ -1,63 +1,108 @@
 #!/usr/bin/env python3
 # merge_gmc_by_category_two_python.py
-# 用法：python merge_gmc_by_category_two_python.py [国家代码]
+# 用法：python merge_gmc_by_category_two_python.py [国家代码] [--mode groupby|rescan|shared] [--sparse] [--workers N] [--memory-budget MB] [--compress gz|zst] [--compress-level N]
 # 示例：python merge_gmc_by_category_two_python.py US
 # 如果指定国家代码，只处理该国家目录，否则处理全部
 
-import os
-import json
-import pandas as pd
 import time
 from pathlib import Path
 import sys
-from typing import List, Dict, Any
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
-def collect_all_codes(category: Dict[str, Any]) -> List[str]:
-    codes = [str(category['code'])]
-    if 'children' in category and category['children']:
-        for child in category['children']:
-            codes.extend(collect_all_codes(child))
-    return codes
+from gmc_columnar import read_country_frame, load_category_groups, select_categories
+from gmc_io import is_csv, csv_name, pandas_compression, add_compression_args
+from gmc_taxonomy import Taxonomy
+from gmc_manifest import CategoryManifest
+from gmc_parallel import add_parallel_args, estimate_frame_mb, run_budgeted
+from gmc_shared import split_country_shared
 
-def get_second_level_categories(top_cat: Dict[str, Any]) -> List[Dict[str, Any]]:
-    return [cat for cat in top_cat.get('children', []) if cat['catalog_depth'] == '2']
-
-def process_second_category(country: str, csv_file: Path, top_cat: Dict[str, Any], second_cat: Dict[str, Any]):
+def process_second_category(country: str, csv_file: Path, taxonomy: Taxonomy, second_code: str,
+                            compress: str = None, compress_level: int = None, frame=None, sparse: bool = False):
+    """写出一个二级类目文件，返回 (输出文件, 行数)；稀疏模式下没有数据时不生成文件，输出文件为 None"""
     output_root = Path(__file__).parent.parent / 'gmc_data' / 'output'
     country_dir = output_root / country
-    all_codes = set(collect_all_codes(second_cat))
-    second_cat_dir = country_dir / top_cat['code'] / second_cat['code']
-    second_cat_dir.mkdir(parents=True, exist_ok=True)
-    out_file = second_cat_dir / f"{second_cat['code']}_{country}.csv"
+    # 输出目录为 <国家>/<一级>/<二级>
+    second_cat_dir = country_dir.joinpath(*taxonomy.path[second_code])
+    out_file = second_cat_dir / csv_name(f"{second_code}_{country}", compress)
 
     try:
-        df = pd.read_csv(csv_file)
-        # 强制类型转换，保证isin判断正确
-        df['ranking_category'] = df['ranking_category'].astype(str)
-        filtered_df = df[df['ranking_category'].isin(all_codes)]
+        if frame is not None:
+            # 分组模式：国家数据已按所属的二级类目分组，直接取出这一组
+            df, groups = frame
+            filtered_df = select_categories(df, groups, [second_code])
+        else:
+            # 有 Parquet 副本时读取列式文件，否则按固定类型读取 CSV
+            df = read_country_frame(csv_file)
+            # 强制类型转换，保证isin判断正确
+            df['ranking_category'] = df['ranking_category'].astype(str)
+            filtered_df = df[df['ranking_category'].isin(set(taxonomy.descendants(second_code)))]
         if not filtered_df.empty:
-            filtered_df.to_csv(out_file, index=False)
+            second_cat_dir.mkdir(parents=True, exist_ok=True)
+            filtered_df.to_csv(out_file, index=False, float_format='%.15g',
+                               compression=pandas_compression(out_file, compress_level))
             print(f"已生成: {out_file} ({len(filtered_df)} 条)")
+            return out_file, len(filtered_df)
+        elif sparse:
+            # 稀疏模式：不写空文件，并删掉以前运行留下的同名文件
+            out_file.unlink(missing_ok=True)
+            return None, 0
         else:
+            second_cat_dir.mkdir(parents=True, exist_ok=True)
             # 仍然写表头
-            df.head(0).to_csv(out_file, index=False)
+            df.head(0).to_csv(out_file, index=False, compression=pandas_compression(out_file, compress_level))
             print(f"已生成: {out_file} (0 条)")
+            return out_file, 0
     except Exception as e:
         print(f"处理 {csv_file} 时出错: {e}")
+        return None, 0
+
+def split_country(country_dir: Path, taxonomy: Taxonomy, args):
+    """拆分一个国家目录下的国家文件并更新类目清单，可在进程池中运行"""
+    country = country_dir.name
+    country_start_time = time.time()
+    csv_files = [f for f in country_dir.iterdir() if f.is_file() and is_csv(f)]
+    manifest = CategoryManifest.load(country_dir)
+    manifest.reset(2)
+    for csv_file in csv_files:
+        csv_start_time = time.time()
+        frame = load_category_groups(csv_file, taxonomy.level_map(2)) if args.mode == 'groupby' else None
+        for second_code in taxonomy.codes_at_depth(2):
+            out_file, rows = process_second_category(country, csv_file, taxonomy, second_code, args.compress,
+                                                     args.compress_level, frame, args.sparse)
+            if out_file is not None:
+                manifest.record(2, second_code, out_file, rows)
+        csv_duration = time.time() - csv_start_time
+        print(f"处理 {country}/{csv_file.name} 完成，用时: {csv_duration:.2f} 秒")
+    manifest.save()
+    country_duration = time.time() - country_start_time
+    print(f"处理国家 {country} 完成，用时: {country_duration:.2f} 秒")
+    return country
 
 def main():
     start_time = time.time()
     # 读取 categories.json
     categories_path = Path(__file__).parent.parent / 'public' / 'categories.json'
-    with open(categories_path, 'r', encoding='utf-8') as f:
-        categories = json.load(f)
-    top_categories = [cat for cat in categories if cat['catalog_depth'] == '1']
+    taxonomy = Taxonomy.load(categories_path)
 
     output_root = Path(__file__).parent.parent / 'gmc_data' / 'output'
     all_country_dirs = [d for d in output_root.iterdir() if d.is_dir()]
 
     # 获取要处理的国家目录
-    target_country = sys.argv[1] if len(sys.argv) > 1 else None
+    parser = argparse.ArgumentParser(description='按二级类目拆分国家数据')
+    parser.add_argument('country', nargs='?', type=str, help='国家代码，如 US。不指定则处理全部国家')
+    parser.add_argument('--mode', choices=['groupby', 'rescan', 'shared'], default='groupby',
+                        help='groupby: 每个国家文件只读取一次，按类目分组后写出全部二级类目（默认）；'
+                             'rescan: 每个类目重新读取一次国家文件；'
+                             'shared: 国家逐个处理，父进程把国家数据加载到共享内存一次，'
+                             '--workers 个子进程只读附加、各写一部分类目，记录按原始字节写出')
+    parser.add_argument('--sparse', action='store_true',
+                        help='只生成有数据的类目文件，不再为没有数据的类目写只有表头的文件；'
+                             '每个国家目录下的 .category_manifest.json 记录各类目的文件和行数')
+    add_compression_args(parser)
+    add_parallel_args(parser)
+    args = parser.parse_args()
+    target_country = args.country
     if target_country:
         country_dirs = [d for d in all_country_dirs if d.name == target_country]
     else:
@@ -68,22 +113,26 @@ def main():
         sys.exit(1)
 
     print(f"开始处理{('国家 ' + target_country) if target_country else '所有国家'}...")
-    for country_dir in country_dirs:
-        country = country_dir.name
-        country_start_time = time.time()
-        csv_files = [f for f in country_dir.iterdir() if f.suffix == '.csv']
-        for csv_file in csv_files:
-            csv_start_time = time.time()
-            for top_cat in top_categories:
-                second_cats = get_second_level_categories(top_cat)
-                for second_cat in second_cats:
-                    process_second_category(country, csv_file, top_cat, second_cat)
-            csv_duration = time.time() - csv_start_time
-            print(f"处理 {country}/{csv_file.name} 完成，用时: {csv_duration:.2f} 秒")
-        country_duration = time.time() - country_start_time
-        print(f"处理国家 {country} 完成，用时: {country_duration:.2f} 秒")
+    if args.mode == 'shared':
+        # 共享内存模式：内存只有一份国家数据，进程用在同一国家的不同类目上
+        pool = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+        try:
+            for country_dir in country_dirs:
+                country_start_time = time.time()
+                split_country_shared(country_dir, taxonomy, 2, args, pool)
+                print(f"处理国家 {country_dir.name} 完成，用时: {time.time() - country_start_time:.2f} 秒")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        total_duration = time.time() - start_time
+        print(f"全部国家和二级类目处理完成（{len(country_dirs)} 个国家），总用时: {total_duration:.2f} 秒")
+        return
+    # 每个国家的内存占用按国家文件大小估算，并行时在 --memory-budget 内准入
+    jobs = [(estimate_frame_mb([f for f in d.iterdir() if f.is_file() and is_csv(f)]), (d, taxonomy, args))
+            for d in country_dirs]
+    finished = list(run_budgeted(split_country, jobs, args.workers, args.memory_budget))
     total_duration = time.time() - start_time
-    print(f"全部国家和二级类目处理完成，总用时: {total_duration:.2f} 秒")
+    print(f"全部国家和二级类目处理完成（{len(finished)} 个国家），总用时: {total_duration:.2f} 秒")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -2,16 +2,149 @@ import os
 import csv
 import json
 import time
+import shutil
+import hashlib
+import argparse
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from gmc_io import (raw_bounds, count_quotes, align_ranges, iter_range_lines, iter_raw_records,
+                    is_csv, csv_name, compression_of, open_text, open_output, add_compression_args,
+                    COMPRESSION_SUFFIXES)
+from gmc_manifest import IngestManifest, TaskMarker
+from gmc_columnar import write_parquet, parquet_path
+from gmc_schema import CANONICAL_HEADER, CANONICAL_HEADER_LINE, normalize_row
+from gmc_dedup import FingerprintSet, record_fingerprint, DEFAULT_MEMORY_MB
+from gmc_catindex import sort_country_file, load_category_index
+from gmc_titleindex import TitleIndex, index_dir, refresh_title_index
+
+def shard_file(task):
+    """子进程任务：把输入文件的一个字节区间按国家拆分到临时目录，每个国家一个无表头的分片文件
+
+    表头已是统一格式（BigQuery 导出）时按原始字节直接复制记录；
+    其它格式（如 exports/ 下带 price_range / relative_demand 的文件）逐行解析并用 normalize_row 转换。
+    完成后写入 TaskMarker，记录区间内容哈希和各国家行数，供中断后重跑时复用。
+    """
+    task_id, file, start, end, file_header, header, tmp_dir = task
+    part_dir = Path(tmp_dir) / f'{task_id:06d}'
+    # 上次未完成的分片直接丢弃
+    if part_dir.exists():
+        shutil.rmtree(part_dir)
+    part_dir.mkdir(parents=True, exist_ok=True)
+    handles = {}
+    counts = {}
+    digest = hashlib.blake2b(digest_size=16)
+
+    def hashed(lines):
+        for line in lines:
+            digest.update(line)
+            yield line
+
+    try:
+        if file_header == header:
+            lines = hashed(iter_range_lines(file, start, end, encoding=None))
+            records = iter_raw_records(lines, header.index('ranking_country'))
+            # 只有从文件开头读取的区间包含表头
+            if start == 0:
+                next(records, None)
+            for country, record in records:
+                if not country:
+                    continue
+                handle = handles.get(country)
+                if handle is None:
+                    handle = handles[country] = open(part_dir / f'{country.decode()}.csv', 'wb')
+                    counts[country] = 0
+                handle.write(record if record.endswith(b'\n') else record + b'\n')
+                counts[country] += 1
+        else:
+            lines = (line.decode('utf-8') for line in hashed(iter_range_lines(file, start, end, encoding=None)))
+            reader = csv.DictReader(lines) if start == 0 else csv.DictReader(lines, fieldnames=file_header)
+            writers = {}
+            for row in reader:
+                if not row or not isinstance(row, dict):
+                    continue
+                country = row.get('ranking_country')
+                if not country:
+                    continue
+                country = country.encode()
+                writer = writers.get(country)
+                if writer is None:
+                    handles[country] = open(part_dir / f'{country.decode()}.csv', 'w', encoding='utf-8', newline='')
+                    writer = writers[country] = csv.writer(handles[country], lineterminator='\n')
+                    counts[country] = 0
+                writer.writerow(normalize_row(row))
+                counts[country] += 1
+    except Exception as e:
+        print(f"处理文件失败: {file} [{start}, {end}), 错误: {e}")
+        return task_id, None
+    finally:
+        for h in handles.values():
+            h.close()
+    counts = {country.decode(): count for country, count in counts.items()}
+    TaskMarker.write(part_dir, file, start, end, digest.hexdigest(), counts)
+    print(f"文件 {Path(file).name} [{start}, {end}) 处理完成，共 {sum(counts.values())} 行")
+    return task_id, counts
+
+def plan_ranges(files, chunk_bytes, run):
+    """把大于 chunk_bytes 的文件切成按记录对齐的字节区间，返回 [(file, start, end), ...]
+
+    第一步并行统计每段的引号数，第二步在主进程里只从每个切分点向后扫描到合法换行。
+    """
+    bounds = {file: raw_bounds(file, chunk_bytes) if chunk_bytes > 0 else [] for file in files}
+    quote_tasks = []
+    for file, file_bounds in bounds.items():
+        edges = [0] + file_bounds
+        quote_tasks.extend((str(file), edges[i], edges[i + 1]) for i in range(len(file_bounds)))
+    quote_counts = iter(run(count_quotes, quote_tasks))
+    ranges = []
+    for file in files:
+        file_bounds = bounds[file]
+        if not file_bounds:
+            # 压缩文件只能整体解压读取，结束位置用 None 表示读到末尾
+            ranges.append((file, 0, None if compression_of(file) else file.stat().st_size))
+            continue
+        counts = [next(quote_counts) for _ in file_bounds]
+        ranges.extend((file, start, end) for start, end in align_ranges(file, file_bounds, counts))
+    return ranges
+
+def read_header(file):
+    """只读取CSV表头"""
+    with open_text(file) as f:
+        return next(csv.reader(f), None)
 
 def main():
-    print('--- 正在运行简化版本 ---')
-    
+    parser = argparse.ArgumentParser(description='按国家拆分GMC导出数据')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='并行处理输入文件的进程数，默认等于CPU核数；1 表示在主进程内顺序处理')
+    parser.add_argument('--chunk-size', type=int, default=256,
+                        help='单个文件超过该大小（MB）时按记录边界切分成多个区间并行解析，0 表示不切分，默认 256')
+    parser.add_argument('--parquet', action='store_true',
+                        help='同时为每个国家生成带类型、字典编码的 <country>.parquet（需要 pyarrow）')
+    parser.add_argument('--no-dedup', dest='dedup', action='store_false',
+                        help='不去除重复行（国家、类目、排名、时间戳、标题都相同的行默认只保留第一条）')
+    parser.add_argument('--dedup-memory', type=int, default=DEFAULT_MEMORY_MB,
+                        help=f'去重指纹集合的内存预算（MB），超出后溢写到临时目录，默认 {DEFAULT_MEMORY_MB}')
+    parser.add_argument('--sort-by-category', action='store_true',
+                        help='国家文件按类目（categories.json 前序位置）和排名排序，并生成 .catidx.json 类目字节区间索引，'
+                             '供按类目提取时直接定位（仅未压缩输出）')
+    parser.add_argument('--title-index', action='store_true',
+                        help='为国家文件生成 product_title 倒排索引 <国家文件>.titleidx，'
+                             '供 merge_gmc_by_country_keyword.py 只读取命中的行（仅未压缩输出）')
+    add_compression_args(parser)
+    args = parser.parse_args()
+    if args.sort_by_category and args.compress:
+        parser.error('--sort-by-category 需要未压缩的国家文件，不能与 --compress 同时使用')
+    if args.title_index and args.compress:
+        parser.error('--title-index 需要未压缩的国家文件，不能与 --compress 同时使用')
+
+    print('--- 正在运行多进程分片版本 ---')
+
     dir_path = Path(__file__).parent.parent / 'gmc_data'
     output_dir = dir_path / 'output'
-    
+    tmp_dir = dir_path / '.merge_tmp'
+
     print('主线程启动')
-    
+
     # 创建输出目录
     if not output_dir.exists():
         try:
@@ -19,68 +152,160 @@ def main():
         except Exception as e:
             print(f'创建输出目录失败: {e}')
             return
-    
-    # 获取所有CSV文件
-    files = [f for f in dir_path.iterdir() 
-             if f.suffix == '.csv' and not f.name.startswith('output/')]
-    
+
+    # 获取所有CSV文件（含 .csv.gz / .csv.zst）
+    files = sorted(f for f in dir_path.iterdir() if f.is_file() and is_csv(f))
+
     if not files:
         print('没有找到需要处理的 .csv 文件。')
         return
-    
-    print(f'待处理文件总数: {len(files)}')
-    
-    header = None
-    country_data = {}
+
+    print(f'待处理文件总数: {len(files)}，进程数: {args.workers}')
+
+    # 输入与上次成功运行时完全一致则无需重建
+    manifest = IngestManifest.load(output_dir)
+    if (set(manifest.files) == {f.name for f in files}
+            and all(manifest.status(f)[0] == 'done' for f in files)
+            and all((output_dir / rel).exists() and rel.endswith(csv_name('', args.compress))
+                    for rel in manifest.outputs)
+            and not (args.parquet and not all(parquet_path(output_dir / rel).exists() for rel in manifest.outputs))
+            and not (args.sort_by_category and not all(load_category_index(output_dir / rel) for rel in manifest.outputs))
+            and all(TitleIndex.open(output_dir / rel) for rel in manifest.outputs
+                    if args.title_index or index_dir(output_dir / rel).exists())):
+        print('输入文件与上次运行一致，国家文件已是最新，跳过。')
+        return
+    # 重建期间清单失效，避免中途失败后被误认为已是最新
+    manifest.path.unlink(missing_ok=True)
+
+    # 输出统一使用 CANONICAL_HEADER，各输入文件的表头决定是原样复制还是逐行转换
+    file_headers = {file: read_header(file) for file in files}
+    header = CANONICAL_HEADER
+    header_line = CANONICAL_HEADER_LINE
     start_time = time.time()
-    
-    for file in files:
-        print(f"正在处理: {file.name}")
-        try:
-            with open(file, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                if not header:
-                    header = reader.fieldnames
-                
-                row_count = 0
-                for row in reader:
-                    if not row or not isinstance(row, dict):
-                        continue
-                    country = row.get('ranking_country')
-                    if not country:
-                        continue
-                    if country not in country_data:
-                        country_data[country] = []
-                    country_data[country].append(row)
-                    row_count += 1
-                print(f"文件 {file.name} 处理完成，共 {row_count} 行")
-        except Exception as e:
-            print(f"处理文件失败: {file}, 错误: {e}")
-            continue
-    
-    print(f"所有文件处理完成，发现国家: {list(country_data.keys())}")
-    
-    # 写入文件
-    for country, rows in country_data.items():
-        if not rows:
+
+    # 每个字节区间是一个任务，各自写入 .merge_tmp/<任务号>/<国家>.csv
+    # 上次运行中已完成且输入未变化的任务直接复用其分片
+    pool = ProcessPoolExecutor(max_workers=args.workers) if args.workers > 1 else None
+    run = pool.map if pool else map
+    try:
+        ranges = plan_ranges(files, args.chunk_size * 1024 * 1024, run)
+        print(f'切分后的任务数: {len(ranges)}')
+        results = []
+        tasks = []
+        for i, (file, start, end) in enumerate(ranges):
+            counts = TaskMarker.load(tmp_dir / f'{i:06d}', file, start, end)
+            if counts is not None:
+                results.append((i, counts))
+            else:
+                tasks.append((i, str(file), start, end, file_headers[file], header, str(tmp_dir)))
+        if results:
+            print(f'复用上次已完成的任务: {len(results)} 个')
+        results.extend(run(shard_file, tasks))
+        finalize(args, results, ranges, files, header_line, output_dir, tmp_dir, manifest, run)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    duration = round(time.time() - start_time, 2)
+    print(f'全部国家文件已生成。总用时: {duration} 秒')
+
+def copy_parts_dedup(parts, country, out, tmp_dir, memory_mb):
+    """按任务顺序把国家分片逐条写入 out，跳过指纹已出现过的行，返回去掉的行数"""
+    removed = 0
+    with FingerprintSet(memory_mb, spill_dir=tmp_dir / 'dedup') as seen:
+        for task_id, _ in parts:
+            with open(tmp_dir / f'{task_id:06d}' / f'{country}.csv', 'rb') as part:
+                for _, record in iter_raw_records(part, 0):
+                    if seen.add(record_fingerprint(record)):
+                        out.write(record)
+                    else:
+                        removed += 1
+        if seen.spills:
+            print(f"  {country}: 指纹集合溢写 {seen.spills} 次")
+    return removed
+
+def finalize(args, results, ranges, files, header_line, output_dir, tmp_dir, manifest, run):
+    """拼接各任务的国家分片、生成列式副本并记录输入清单"""
+    # 汇总各任务的国家分片，失败的任务整体丢弃
+    country_parts = {}
+    for task_id, counts in sorted(results):
+        if counts is None:
             continue
-        
+        for country, count in counts.items():
+            country_parts.setdefault(country, []).append((task_id, count))
+
+    print(f"所有文件处理完成，发现国家: {list(country_parts.keys())}")
+
+    # 按任务顺序拼接分片，输出顺序与逐个文件处理时一致；去重时保留每行第一次出现的位置
+    dedup_counts = {}
+    for country, parts in country_parts.items():
         # 确保国家目录存在
         country_dir = output_dir / country
         country_dir.mkdir(parents=True, exist_ok=True)
-        out_path = country_dir / f'{country}.csv'
-        
+        out_path = country_dir / csv_name(country, args.compress)
+
+        # 先写临时文件再替换，中断时不会留下不完整的国家文件
+        tmp_path = out_path.with_name(out_path.name + '.tmp')
         try:
-            with open(out_path, 'w', encoding='utf-8', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=header)
-                writer.writeheader()
-                writer.writerows(rows)
-            print(f"已生成: {out_path} ({len(rows)} 条)")
+            with open_output(tmp_path, 'wb', args.compress_level, compression=args.compress) as f:
+                f.write(header_line)
+                if args.dedup:
+                    dedup_counts[country] = copy_parts_dedup(parts, country, f, tmp_dir, args.dedup_memory)
+                else:
+                    for task_id, _ in parts:
+                        with open(tmp_dir / f'{task_id:06d}' / f'{country}.csv', 'rb') as part:
+                            shutil.copyfileobj(part, f, 1024 * 1024)
+            os.replace(tmp_path, out_path)
+            # 删除其它压缩格式的旧国家文件，避免下游脚本重复处理
+            for compression in [None, *COMPRESSION_SUFFIXES.values()]:
+                stale = country_dir / csv_name(country, compression)
+                if stale != out_path and stale.exists():
+                    stale.unlink()
+                    refresh_title_index(stale)
+            total = sum(count for _, count in parts) - dedup_counts.get(country, 0)
+            print(f"已生成: {out_path} ({total} 条)")
         except Exception as e:
             print(f'写入文件 {out_path} 时出错: {e}')
-    
-    duration = round(time.time() - start_time, 2)
-    print(f'全部国家文件已生成。总用时: {duration} 秒')
+
+    if args.dedup:
+        removed = {country: count for country, count in dedup_counts.items() if count}
+        print(f"去除重复行: 共 {sum(removed.values())} 条" + (f"，{removed}" if removed else ''))
+
+    if args.sort_by_category:
+        for path in run(sort_country_file, [output_dir / c / csv_name(c, args.compress) for c in country_parts]):
+            print(f"已生成: {path}")
+
+    # 排序会改写国家文件，标题索引在排序之后生成；没有指定 --title-index 时也重建已有的索引
+    paths = [output_dir / c / csv_name(c, args.compress) for c in country_parts]
+    for path in run(refresh_title_index, paths, [args.title_index] * len(paths)):
+        if path:
+            print(f"已生成: {path}")
+
+    if args.parquet:
+        for path in run(write_parquet, [output_dir / c / csv_name(c, args.compress) for c in country_parts]):
+            if path:
+                print(f"已生成: {path}")
+
+    # 有失败的任务时保留临时目录，重跑时只需处理失败的部分
+    failed = [task_id for task_id, counts in results if counts is None]
+    if failed:
+        print(f'有 {len(failed)} 个任务失败，保留临时目录 {tmp_dir} 以便重跑')
+    else:
+        # 全部成功后记录输入清单；未切分的文件区间哈希即整个文件的哈希
+        task_counts = dict(results)
+        manifest.files = {}
+        for i, (file, start, end) in enumerate(ranges):
+            entry = manifest.files.get(file.name) or manifest.begin(file)
+            entry['rows'] += sum(task_counts[i].values())
+            entry['offset'] = end
+            entry['done'] = True
+            if start == 0 and end == entry['size'] and not compression_of(file):
+                with open(tmp_dir / f'{i:06d}' / TaskMarker.NAME, 'r', encoding='utf-8') as f:
+                    entry['hash'] = json.load(f)['hash']
+        manifest.outputs = {f'{c}/{csv_name(c, args.compress)}': (output_dir / c / csv_name(c, args.compress)).stat().st_size
+                            for c in country_parts}
+        manifest.save()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
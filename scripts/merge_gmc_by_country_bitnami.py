@@ -1,16 +1,42 @@
+import io
 import os
 import csv
 import time
+import argparse
 from pathlib import Path
 
+from gmc_io import (OutputPool, DEFAULT_MAX_OPEN, DEFAULT_BUFFER_SIZE, iter_raw_records, read_header_line,
+                    is_csv, csv_name, compression_of, open_input, skip_bytes, add_compression_args, COMPRESSION_SUFFIXES)
+from gmc_manifest import IngestManifest, HashingReader
+from gmc_columnar import write_parquet
+from gmc_schema import CANONICAL_HEADER, CANONICAL_HEADER_LINE, normalize_record
+from gmc_dedup import FingerprintSet, record_fingerprint, DEFAULT_MEMORY_MB
+from gmc_titleindex import refresh_title_index
+
 def main():
+    parser = argparse.ArgumentParser(description='按国家流式拆分GMC导出数据（低内存版本）')
+    parser.add_argument('--max-open-files', type=int, default=DEFAULT_MAX_OPEN,
+                        help=f'同时保持打开的国家文件数上限，默认 {DEFAULT_MAX_OPEN}')
+    parser.add_argument('--buffer-size', type=int, default=DEFAULT_BUFFER_SIZE,
+                        help=f'每个输出文件的写缓冲字节数，默认 {DEFAULT_BUFFER_SIZE}')
+    parser.add_argument('--checkpoint-rows', type=int, default=500000,
+                        help='每处理多少行提交一次检查点，默认 500000')
+    parser.add_argument('--parquet', action='store_true',
+                        help='同时为每个国家生成带类型、字典编码的 <country>.parquet（需要 pyarrow）')
+    parser.add_argument('--no-dedup', dest='dedup', action='store_false',
+                        help='不去除重复行（国家、类目、排名、时间戳、标题都相同的行默认只保留第一条）')
+    parser.add_argument('--dedup-memory', type=int, default=DEFAULT_MEMORY_MB,
+                        help=f'去重指纹集合的内存预算（MB），超出后溢写到临时目录，默认 {DEFAULT_MEMORY_MB}')
+    add_compression_args(parser)
+    args = parser.parse_args()
+
     print('--- 正在运行 Bitnami 低内存版本 ---')
-    
+
     dir_path = Path(__file__).parent.parent / 'gmc_data'
     output_dir = dir_path / 'output'
-    
+
     print('主线程启动')
-    
+
     # 创建输出目录
     if not output_dir.exists():
         try:
@@ -18,63 +44,132 @@ def main():
         except Exception as e:
             print(f'创建输出目录失败: {e}')
             return
-    
-    # 获取所有CSV文件
-    files = [f for f in dir_path.iterdir() 
-             if f.suffix == '.csv' and not f.name.startswith('output/')]
-    
+
+    # 获取所有CSV文件（含 .csv.gz / .csv.zst），排序保证中断后重跑时处理顺序一致
+    files = sorted(f for f in dir_path.iterdir() if f.is_file() and is_csv(f))
+
     if not files:
         print('没有找到需要处理的 .csv 文件。')
         return
-    
+
     print(f'待处理文件总数: {len(files)}')
-    
-    header_written = {}
+
+    # 输出恢复到上次提交的状态，避免中断时多写的行在重跑后重复
+    manifest = IngestManifest.load(output_dir)
+    existing = [f'{d.name}/{csv_name(d.name, c)}' for d in output_dir.iterdir() if d.is_dir()
+                for c in [None, *COMPRESSION_SUFFIXES.values()] if (d / csv_name(d.name, c)).is_file()]
+    if existing and not manifest.exists:
+        print(f'没有找到输入清单，重置已有的 {len(existing)} 个国家文件')
+    manifest.rollback(output_dir, existing)
+
     start_time = time.time()
-    
-    for file in files:
-        print(f"正在处理: {file.name}")
-        try:
-            with open(file, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                header = reader.fieldnames
-                row_count = 0
-                country_rows = {}
-                for row in reader:
-                    if not row or not isinstance(row, dict):
-                        continue
-                    country = row.get('ranking_country')
-                    if not country:
-                        continue
-                    if country not in country_rows:
-                        country_rows[country] = []
-                    country_rows[country].append(row)
-                    row_count += 1
-                print(f"文件 {file.name} 处理完成，共 {row_count} 行")
-                
-                # 处理每个国家，直接写入文件（append模式）
-                for country, rows in country_rows.items():
-                    if not rows:
-                        continue
-                    country_dir = output_dir / country
-                    country_dir.mkdir(parents=True, exist_ok=True)
-                    out_path = country_dir / f'{country}.csv'
-                    write_header = False
-                    if country not in header_written:
-                        write_header = True
-                        header_written[country] = True
-                    with open(out_path, 'a', encoding='utf-8', newline='') as out_f:
-                        writer = csv.DictWriter(out_f, fieldnames=header)
-                        if write_header and out_path.stat().st_size == 0:
-                            writer.writeheader()
-                        writer.writerows(rows)
-                    print(f"已追加: {out_path} ({len(rows)} 条)")
-        except Exception as e:
-            print(f"处理文件失败: {file}, 错误: {e}")
-            continue
-    
+    # 所有国家文件使用统一的 CANONICAL_HEADER
+    pool = OutputPool(CANONICAL_HEADER_LINE, args.max_open_files, args.buffer_size, args.compress_level)
+    country_counts = {}
+    dedup_counts = {}
+
+    def load_seen():
+        """新建指纹集合并载入已提交的国家文件里的行：中断后继续或回滚后，只有这些行参与去重"""
+        seen = FingerprintSet(args.dedup_memory, spill_dir=dir_path / '.dedup_tmp')
+        if manifest.outputs:
+            for rel in manifest.outputs:
+                with open_input(output_dir / rel) as f:
+                    f.readline()
+                    for _, record in iter_raw_records(f, 0):
+                        seen.add(record_fingerprint(record))
+            print(f'已从现有国家文件载入 {len(seen)} 个行指纹')
+        return seen
+
+    seen = load_seen() if args.dedup else None
+
+    def output_sizes():
+        pool.flush()
+        sizes = dict(manifest.outputs)
+        for path in pool.paths:
+            sizes[f'{path.parent.name}/{path.name}'] = os.path.getsize(path)
+        return sizes
+
+    try:
+        for file in files:
+            status, offset = manifest.status(file)
+            if status == 'done':
+                print(f"跳过已完成: {file.name}")
+                continue
+            if status == 'changed':
+                print(f"输入文件已变化，无法增量处理: {file.name}，请删除 output 目录后重新运行")
+                continue
+            if status == 'new':
+                manifest.begin(file)
+            rows_done = manifest.files[file.name]['rows']
+            print(f"正在处理: {file.name}" + (f"（从第 {offset} 字节继续）" if offset else ''))
+            try:
+                file_header_line = read_header_line(file)
+                file_header = next(csv.reader([file_header_line.decode('utf-8')]), [])
+                if not file_header:
+                    continue
+                country_idx = file_header.index('ranking_country')
+                # 压缩文件的偏移是解压后的位置，只能从头解压后向前跳过
+                compressed = compression_of(file) is not None
+                hashing = HashingReader(file, 0 if compressed else offset)
+                with open_input(file, io.BufferedReader(hashing, args.buffer_size)) as f:
+                    if offset == 0:
+                        f.readline()
+                    elif compressed:
+                        skip_bytes(f, offset)
+                    row_count = 0
+                    # 逐条记录直接写入对应国家的缓存句柄
+                    for country, record in iter_raw_records(f, country_idx):
+                        if not country:
+                            continue
+                        if file_header != CANONICAL_HEADER:
+                            record = normalize_record(record, file_header)
+                        elif not record.endswith(b'\n'):
+                            record += b'\n'
+                        country = country.decode('utf-8')
+                        row_count += 1
+                        if seen is None or seen.add(record_fingerprint(record)):
+                            pool.write(output_dir / country / csv_name(country, args.compress), record)
+                            country_counts[country] = country_counts.get(country, 0) + 1
+                        else:
+                            dedup_counts[country] = dedup_counts.get(country, 0) + 1
+                        if row_count % args.checkpoint_rows == 0:
+                            manifest.commit(file, f.tell(), rows_done + row_count, output_sizes())
+                    manifest.commit(file, f.tell(), rows_done + row_count, output_sizes(), hashing.hash.hexdigest())
+                    print(f"文件 {file.name} 处理完成，共 {rows_done + row_count} 行")
+            except Exception as e:
+                print(f"处理文件失败: {file}, 错误: {e}")
+                # 丢弃该文件上次检查点之后写入的内容
+                pool.close()
+                manifest.rollback(output_dir, [f'{p.parent.name}/{p.name}' for p in pool.paths if p.exists()])
+                # 被丢弃的行的指纹也要去掉，否则其它文件里相同的行会被误当作重复跳过
+                if seen is not None:
+                    seen.close()
+                    seen = load_seen()
+                continue
+    finally:
+        pool.close()
+        if seen is not None:
+            seen.close()
+
+    for country, count in country_counts.items():
+        print(f"已追加: {output_dir / country / csv_name(country, args.compress)} ({count} 条)")
+    if dedup_counts:
+        print(f"去除重复行: 共 {sum(dedup_counts.values())} 条，{dedup_counts}")
+
+    # 追加、截断或删除过的国家文件，已有的标题索引随之重建或删除（未变化的文件索引仍有效，不重建）
+    for path in sorted({output_dir / rel for rel in existing} | pool.paths):
+        index_path = refresh_title_index(path)
+        if index_path:
+            print(f"已生成: {index_path}")
+
+    if args.parquet:
+        for rel in manifest.outputs:
+            path = write_parquet(output_dir / rel)
+            if path:
+                print(f"已生成: {path}")
+
     duration = round(time.time() - start_time, 2)
-    print(f'全部国家文件已生成。总用时: {duration} 秒')
+    print(f'全部国家文件已生成。打开文件次数: {pool.opens}，总用时: {duration} 秒')
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -5,19 +5,22 @@ GMC数据按国家和类目合并处理脚本
 
 功能说明:
     此脚本用于从GMC数据中按指定国家和类目ID筛选产品数据，并生成合并后的CSV报告文件。
-    脚本会递归查找指定类目的所有子类目，并将匹配的产品数据合并到一个CSV文件中。
+    脚本会查找指定类目的所有子类目，并将匹配的产品数据合并到一个CSV文件中。
+    可以一次指定多个类目ID，只扫描一次国家文件就生成全部输出；类目之间互相包含时，
+    一行会同时写入每个匹配的输出。
 
 使用前提:
     1. 确保存在 gmc_data/output/{country}/ 目录结构
     2. 确保存在 public/categories.json 文件（包含类目层级结构）
-    3. 目标国家目录下应包含CSV格式的GMC数据文件
+    3. 目标国家目录下应包含CSV格式的GMC数据文件（支持 .csv.gz / .csv.zst）
 
 使用方法:
-    python merge_gmc_by_country_category.py <country_code> <category_id>
+    python merge_gmc_by_country_category.py <country_code> <category_id> [category_id ...] [--ids-file FILE] [--compress gz|zst] [--compress-level N]
 
 参数说明:
     country_code: 国家代码，如 US（美国）、AE（阿联酋）、GB（英国）等
-    category_id: 类目ID，如 5406（电子产品）、1420（服装）等
+    category_id: 类目ID，如 5406（电子产品）、1420（服装）等，可以给多个
+    --ids-file: 类目ID列表文件，每行一个或多个ID，# 之后为注释
 
 使用示例:
     # 处理美国电子产品类目
@@ -28,9 +31,14 @@ GMC数据按国家和类目合并处理脚本
     
     # 处理英国家居用品类目
     python merge_gmc_by_country_category.py GB 166
+    
+    # 一次扫描生成美国的多个类目
+    python merge_gmc_by_country_category.py US 5406 1420 166
+    python merge_gmc_by_country_category.py US --ids-file us_categories.txt
 
 输出结果:
-    - 输出文件位置: gmc_data/output/{country}/report/{country}_{category_id}.csv
+    - 输出文件位置: gmc_data/output/{country}/report/{country}_{category_id}.csv（每个类目ID一个）
+      （指定 --compress 时为 .csv.gz / .csv.zst）
     - 包含指定类目及其所有子类目的产品数据
     - 保持原始CSV文件的列结构
 
@@ -38,6 +46,7 @@ GMC数据按国家和类目合并处理脚本
     - 脚本会自动创建输出目录
     - 如果输出文件已存在，会被覆盖
     - 支持大文件流式处理，内存占用较低
+    - 国家文件由 --sort-by-category 排序并带有 .catidx.json 索引时，直接按字节区间读取，不再全量扫描
     - 会显示处理进度和统计信息
 
 作者: [作者名称]
@@ -45,42 +54,57 @@ GMC数据按国家和类目合并处理脚本
 版本: 1.0
 """
 
-import os
-import json
 import csv
-import sys
 import argparse
 from pathlib import Path
 
-def find_category_by_id(categories, target_id):
-    """递归查找指定ID的类目"""
-    for category in categories:
-        if category['code'] == target_id:
-            return category
-        if category.get('children') and len(category['children']) > 0:
-            result = find_category_by_id(category['children'], target_id)
-            if result:
-                return result
-    return None
+from gmc_io import (OutputPool, DEFAULT_MAX_OPEN, read_header_line, is_csv, csv_name, open_output,
+                    add_compression_args)
+from gmc_taxonomy import Taxonomy
+from gmc_catindex import load_category_index, subtree_ranges
+from gmc_scan import category_finder, iter_candidate_records
+
+def copy_bytes(src, dst, n, block=1024 * 1024):
+    """从 src 当前位置复制 n 字节到 dst"""
+    while n > 0:
+        data = src.read(min(block, n))
+        if not data:
+            break
+        dst.write(data)
+        n -= len(data)
 
-def collect_all_codes(category):
-    """递归收集所有子类目 code"""
-    codes = [category['code']]
-    if category.get('children') and len(category['children']) > 0:
-        for child in category['children']:
-            codes.extend(collect_all_codes(child))
-    return codes
+def read_category_ids(values, ids_file=None):
+    """合并命令行和文件中的类目ID，去重并保持顺序；文件中每行可写多个ID（逗号或空白分隔），# 之后为注释"""
+    ids = []
+    for value in values:
+        ids.extend(value.replace(',', ' ').split())
+    if ids_file:
+        with open(ids_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                ids.extend(line.split('#', 1)[0].replace(',', ' ').split())
+    return list(dict.fromkeys(ids))
 
 def main():
     # 解析命令行参数
     parser = argparse.ArgumentParser(description='按国家和类目处理GMC数据')
     parser.add_argument('country', type=str, help='国家代码，如 US, AE 等')
-    parser.add_argument('category_id', type=str, help='类目ID，如 5406')
-    args = parser.parse_args()
+    parser.add_argument('category_ids', nargs='*', metavar='category_id',
+                        help='类目ID，如 5406；可以给多个（空格或逗号分隔），一次扫描生成全部输出')
+    parser.add_argument('--ids-file', type=str,
+                        help='从文件读取类目ID，每行一个或多个（逗号/空白分隔），# 之后为注释')
+    parser.add_argument('--max-open-files', type=int, default=DEFAULT_MAX_OPEN,
+                        help=f'同时保持打开的输出文件数上限，默认 {DEFAULT_MAX_OPEN}')
+    add_compression_args(parser)
+    # 类目ID可以和选项穿插书写
+    args = parser.parse_intermixed_args()
+    
+    category_ids = read_category_ids(args.category_ids, args.ids_file)
+    if not category_ids:
+        parser.error('至少需要一个类目ID（命令行参数或 --ids-file）')
     
     print("--- 开始运行 merge_gmc_by_country_category.py ---")
     print(f"国家: {args.country}")
-    print(f"类目ID: {args.category_id}")
+    print(f"类目ID: {category_ids}")
     
     # 读取 categories.json
     categories_path = Path(__file__).parent.parent / 'public' / 'categories.json'
@@ -91,20 +115,24 @@ def main():
         print("错误: categories.json 文件不存在！")
         return
     
-    with open(categories_path, 'r', encoding='utf-8') as f:
-        categories = json.load(f)
+    taxonomy = Taxonomy.load(categories_path)
     
-    # 查找指定的类目
-    target_category = find_category_by_id(categories, args.category_id)
-    if not target_category:
-        print(f"错误: 没有找到类目ID {args.category_id}！")
+    # 查找指定的类目，找不到的跳过
+    missing = [category_id for category_id in category_ids if category_id not in taxonomy]
+    for category_id in missing:
+        print(f"错误: 没有找到类目ID {category_id}！")
+    category_ids = [category_id for category_id in category_ids if category_id in taxonomy]
+    if not category_ids:
         return
     
-    print(f"找到类目: {target_category.get('catalog_name', '')} (ID: {target_category['code']})")
-    
-    # 收集所有子类目代码
-    all_codes = set(collect_all_codes(target_category))
-    print(f"类目 {args.category_id} 包含的所有code: {list(all_codes)}")  # 打印全部
+    # 子树在前序表中是连续区间，直接取出所有子类目代码；
+    # 请求的类目之间可能互相包含，一个行类目可以对应多个输出
+    routes = {}
+    for category_id in category_ids:
+        codes = taxonomy.descendants(category_id)
+        print(f"找到类目: {taxonomy.name[category_id]} (ID: {category_id})，包含 {len(codes)} 个code")
+        for code in codes:
+            routes.setdefault(code.encode('utf-8'), []).append(category_id)
     
     # 查找国家目录
     gmc_data_root = Path(__file__).parent.parent / 'gmc_data' / 'output'
@@ -118,7 +146,7 @@ def main():
         return
     
     # 查找CSV文件
-    csv_files = [f for f in country_dir.iterdir() if f.suffix == '.csv']
+    csv_files = [f for f in country_dir.iterdir() if f.is_file() and is_csv(f)]
     print(f"找到CSV文件: {[f.name for f in csv_files]}")
     
     if not csv_files:
@@ -128,6 +156,8 @@ def main():
     # 输出目录为国家下的report目录
     output_dir = country_dir / 'report'
     output_dir.mkdir(parents=True, exist_ok=True)
+    output_paths = {category_id: output_dir / csv_name(f"{args.country}_{category_id}", args.compress)
+                    for category_id in category_ids}
     
     total_products = 0
     
@@ -136,36 +166,52 @@ def main():
         print(f"\n处理文件: {csv_file.name}")
         csv_path = country_dir / csv_file.name
         
-        # 生成输出文件名
-        output_filename = f"{args.country}_{args.category_id}.csv"
-        output_path = output_dir / output_filename
-        
-        print(f"输出文件: {output_path}")
+        # 国家文件已按类目排序并有索引时，每个类目子树是一段连续字节，直接 seek 复制
+        index = load_category_index(csv_path, taxonomy)
+        if index is not None:
+            with open(csv_path, 'rb') as f:
+                header_line = f.read(index['header_size'])
+                for category_id, output_path in output_paths.items():
+                    spans, count = subtree_ranges(index, taxonomy, category_id)
+                    with open_output(output_path, 'wb', args.compress_level) as out_f:
+                        out_f.write(header_line)
+                        for start, end in spans:
+                            f.seek(start)
+                            copy_bytes(f, out_f, end - start)
+                    print(f"已生成: {output_path} ({count} 条，按类目索引读取)")
+                    total_products += count
+            continue
         
-        # 先写表头
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            first_line = f.readline().strip()
+        # 按原始字节筛选：未压缩文件先在 mmap 上用类目 code 的字节模式找候选记录，
+        # 只取 ranking_category 列比较，命中的记录原样写入它所属的每个输出
+        counts = dict.fromkeys(category_ids, 0)
+        for output_path in output_paths.values():
+            output_path.unlink(missing_ok=True)
+        header_line = read_header_line(csv_path)
+        category_idx = next(csv.reader([header_line.decode('utf-8')])).index('ranking_category')
+        finder = category_finder([code.decode('utf-8') for code in routes])
+        pool = OutputPool(header_line, args.max_open_files, level=args.compress_level)
+        try:
+            for category, record in iter_candidate_records(csv_path, category_idx, finder):
+                targets = routes.get(category)
+                if targets is None:
+                    continue
+                for category_id in targets:
+                    pool.write(output_paths[category_id], record)
+                    counts[category_id] += 1
+        finally:
+            pool.close()
         
-        with open(output_path, 'w', encoding='utf-8', newline='') as f:
-            f.write(first_line + '\n')
-        
-        # 流式读取和筛选
-        count = 0
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            with open(output_path, 'a', encoding='utf-8', newline='') as out_f:
-                writer = csv.DictWriter(out_f, fieldnames=reader.fieldnames)
-                
-                for row in reader:
-                    if row['ranking_category'] in all_codes:
-                        writer.writerow(row)
-                        count += 1
-        
-        print(f"已生成: {output_path} ({count} 条)")
-        total_products += count
-    
-    print(f"\n处理完成！总共找到 {total_products} 个产品。")
-    print(f"输出文件: {output_dir / f'{args.country}_{args.category_id}.csv'}")
+        for category_id, output_path in output_paths.items():
+            if not counts[category_id]:
+                # 没有数据的类目也生成只有表头的文件
+                with open_output(output_path, 'wb', args.compress_level) as out_f:
+                    out_f.write(header_line)
+            print(f"已生成: {output_path} ({counts[category_id]} 条)")
+        total_products += sum(counts.values())
+    
+    print(f"\n处理完成！{len(category_ids)} 个类目总共找到 {total_products} 个产品。")
+    print(f"输出目录: {output_dir}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
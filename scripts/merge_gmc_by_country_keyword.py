@@ -1,20 +1,100 @@
-import os
-import json
+import re
 import csv
-import sys
 import argparse
 from pathlib import Path
 
+from gmc_io import (OutputPool, DEFAULT_MAX_OPEN, DEFAULT_BUFFER_SIZE, read_header_line, is_csv, csv_name,
+                    open_output, add_compression_args)
+from gmc_scan import keyword_finder, iter_candidate_records
+from gmc_titleindex import (TitleIndex, DEFAULT_FUZZY_THRESHOLD, build_title_index, iter_indexed_records,
+                            iter_fuzzy_records, normalize_title, fuzzy_similarity)
+from gmc_keywords import KeywordAutomaton, read_keywords
+from gmc_query import QueryError, compile_query, select_records
+
+# 批量模式缓存的不同标题数上限：同一商品在不同周、不同排名中标题相同，只需匹配一次
+TITLE_CACHE_SIZE = 100000
+
+def extract_keywords_batch(country, csv_files, output_dir, keywords, args):
+    """一次扫描国家文件，为每个关键词写出 report/<国家>_<关键词>.csv，返回各关键词的条数"""
+    automaton = KeywordAutomaton([keyword.lower() for keyword in keywords])
+    paths = [output_dir / csv_name(f"{country}_{keyword}", args.compress) for keyword in keywords]
+    # OutputPool 以追加方式写入，先删除上次的结果
+    for path in paths:
+        path.unlink(missing_ok=True)
+    counts = [0] * len(keywords)
+    header_line = None
+    matched = {}
+    for csv_file in csv_files:
+        print(f"\n处理文件: {csv_file.name}")
+        header_line = read_header_line(csv_file)
+        title_idx = next(csv.reader([header_line.decode('utf-8')])).index('product_title')
+        with OutputPool(header_line, args.max_open_files, DEFAULT_BUFFER_SIZE, args.compress_level) as pool:
+            for title, record in iter_candidate_records(csv_file, title_idx):
+                hits = matched.get(title)
+                if hits is None:
+                    if len(matched) >= TITLE_CACHE_SIZE:
+                        matched.clear()
+                    hits = matched[title] = tuple(automaton.search(title.decode('utf-8').lower()))
+                for i in hits:
+                    pool.write(paths[i], record)
+                    counts[i] += 1
+    # 没有命中的关键词也生成只有表头的文件
+    for path, count in zip(paths, counts):
+        if not count and header_line is not None:
+            with open_output(path, 'wb', args.compress_level) as out_f:
+                out_f.write(header_line)
+    for path, count in zip(paths, counts):
+        print(f"已生成: {path} ({count} 条)")
+    return counts
+
 def main():
     # 解析命令行参数
     parser = argparse.ArgumentParser(description='按国家和关键词处理GMC数据')
     parser.add_argument('country', type=str, help='国家代码，如 US, AE 等')
-    parser.add_argument('keyword', type=str, help='搜索关键词，用于在product_title中模糊查询')
+    parser.add_argument('keyword', type=str, nargs='?',
+                        help='搜索关键词，用于在product_title中模糊查询；使用 --query 时作为输出文件名')
+    parser.add_argument('--query', type=str,
+                        help='字段查询，如 \'title:"dog food" AND NOT brand:Purina AND price<50 AND demand>=high '
+                             'AND category:1\'，语法见 gmc_query.py；输出文件名取 keyword，未给出时由查询生成')
+    parser.add_argument('--keywords-file', type=str,
+                        help='批量模式：从文件读取关键词（每行一个，# 开头为注释），'
+                             '一次扫描为每个关键词生成 report/<国家>_<关键词>.csv')
+    parser.add_argument('--max-open-files', type=int, default=DEFAULT_MAX_OPEN,
+                        help=f'批量模式同时保持打开的输出文件数上限，默认 {DEFAULT_MAX_OPEN}')
+    parser.add_argument('--build-index', action='store_true',
+                        help='先为国家文件生成（或重建已过期的）product_title 倒排索引 <国家文件>.titleidx，再按索引查询')
+    parser.add_argument('--fuzzy', action='store_true',
+                        help='模糊匹配：按归一化标题（小写、去掉空格和标点）的三字符片段相似度匹配，容忍拼写错误和空格差异；'
+                             '有 .titleidx 索引时只校验候选行')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_FUZZY_THRESHOLD,
+                        help=f'模糊匹配的相似度阈值（0~1，查询片段出现在标题中的比例），默认 {DEFAULT_FUZZY_THRESHOLD}')
+    add_compression_args(parser)
     args = parser.parse_args()
+    if not 0 < args.threshold <= 1:
+        parser.error('--threshold 应在 (0, 1] 范围内')
+    if args.fuzzy and args.keywords_file:
+        parser.error('--fuzzy 不能与 --keywords-file 同时使用')
+    if args.query is not None and (args.fuzzy or args.keywords_file):
+        parser.error('--query 不能与 --fuzzy、--keywords-file 同时使用')
+    if args.query is not None:
+        try:
+            plan = compile_query(args.query)
+        except QueryError as e:
+            parser.error(f'查询无效: {e}')
+        if args.keyword is None:
+            args.keyword = re.sub(r'[^\w.-]+', '_', args.query).strip('_')[:100] or 'query'
+    keywords = ([args.keyword] if args.keyword is not None else []) + (
+        read_keywords(args.keywords_file) if args.keywords_file else [])
+    keywords = list(dict.fromkeys(keywords))
+    if not keywords:
+        parser.error('至少需要一个关键词（命令行参数或 --keywords-file）')
     
     print("--- 开始运行 merge_report_by_country_keyword.py ---")
     print(f"国家: {args.country}")
-    print(f"关键词: {args.keyword}")
+    if args.query is not None:
+        print(f"查询: {args.query}")
+    else:
+        print(f"关键词: {args.keyword}" if not args.keywords_file else f"关键词: {len(keywords)} 个（批量模式）")
     
     # 查找国家目录
     gmc_data_root = Path(__file__).parent.parent / 'gmc_data' / 'output'
@@ -28,7 +108,7 @@ def main():
         return
     
     # 查找CSV文件
-    csv_files = [f for f in country_dir.iterdir() if f.suffix == '.csv']
+    csv_files = [f for f in country_dir.iterdir() if f.is_file() and is_csv(f)]
     print(f"找到CSV文件: {[f.name for f in csv_files]}")
     
     if not csv_files:
@@ -39,6 +119,11 @@ def main():
     output_dir = country_dir / 'report'
     output_dir.mkdir(parents=True, exist_ok=True)
     
+    if args.keywords_file:
+        counts = extract_keywords_batch(args.country, csv_files, output_dir, keywords, args)
+        print(f"\n处理完成！{len(keywords)} 个关键词共找到 {sum(counts)} 个产品。")
+        return
+    
     total_products = 0
     
     # 处理每个CSV文件
@@ -47,37 +132,63 @@ def main():
         csv_path = country_dir / csv_file.name
         
         # 生成输出文件名
-        output_filename = f"{args.country}_{args.keyword}.csv"
+        output_filename = csv_name(f"{args.country}_{args.keyword}", args.compress)
         output_path = output_dir / output_filename
         
         print(f"输出文件: {output_path}")
         
-        # 先写表头
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            first_line = f.readline().strip()
-        
-        with open(output_path, 'w', encoding='utf-8', newline='') as f:
-            f.write(first_line + '\n')
-        
-        # 流式读取和筛选
+        if args.query is not None:
+            # 只读取查询用到的列求出命中的行，再按行号复制原始记录
+            count = 0
+            with open_output(output_path, 'wb', args.compress_level) as out_f:
+                out_f.write(read_header_line(csv_path))
+                for record in select_records(csv_path, plan):
+                    out_f.write(record)
+                    count += 1
+            print(f"执行计划:\n{plan.explain()}")
+            print(f"已生成: {output_path} ({count} 条)")
+            total_products += count
+            continue
+
+        if args.build_index and TitleIndex.open(csv_path) is None:
+            index_path = build_title_index(csv_path)
+            print(f"已生成索引: {index_path}" if index_path else "压缩文件不支持标题索引，按全量扫描查询")
+
+        # 按原始字节筛选：有 .titleidx 倒排索引时只读取索引给出的候选记录；
+        # 否则纯 ASCII 关键词先在 mmap 上按忽略大小写的字节模式找候选记录，
+        # 只解码候选记录的 product_title 列，命中的记录原样写出
+        # 模糊匹配时索引按三字符片段给出候选，没有索引时逐条计算相似度
+        keyword = args.keyword.lower()
+        query = normalize_title(args.keyword)
         count = 0
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            with open(output_path, 'a', encoding='utf-8', newline='') as out_f:
-                writer = csv.DictWriter(out_f, fieldnames=reader.fieldnames)
-                
-                for row in reader:
+        with open_output(output_path, 'wb', args.compress_level) as out_f:
+            header_line = read_header_line(csv_path)
+            out_f.write(header_line)
+            title_idx = next(csv.reader([header_line.decode('utf-8')])).index('product_title')
+            if args.fuzzy:
+                records = iter_fuzzy_records(csv_path, title_idx, query, args.threshold)
+            else:
+                records = iter_indexed_records(csv_path, title_idx, keyword)
+            if records is None:
+                records = iter_candidate_records(csv_path, title_idx, None if args.fuzzy else keyword_finder(keyword))
+            else:
+                print("使用标题索引查询")
+            for title, record in records:
+                title = title.decode('utf-8')
+                if args.fuzzy:
+                    matched = fuzzy_similarity(query, title) >= args.threshold
+                else:
                     # 检查product_title是否包含关键词（不区分大小写）
-                    product_title = row.get('product_title', '').lower()
-                    if args.keyword.lower() in product_title:
-                        writer.writerow(row)
-                        count += 1
+                    matched = keyword in title.lower()
+                if matched:
+                    out_f.write(record)
+                    count += 1
         
         print(f"已生成: {output_path} ({count} 条)")
         total_products += count
     
     print(f"\n处理完成！总共找到 {total_products} 个产品。")
-    print(f"输出文件: {output_dir / f'{args.country}_{args.keyword}.csv'}")
+    print(f"输出文件: {output_dir / csv_name(f'{args.country}_{args.keyword}', args.compress)}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# merge_gmc_fanout.py
+# 用法：python merge_gmc_fanout.py [--levels 3] [--sparse] [--compress gz|zst] [--no-dedup] [--parquet] [--sort-by-category] [--title-index]
+# 一次顺序读取 gmc_data 下的原始导出文件，同时生成：
+#   output/<国家>/<国家>.csv                                  （merge_gmc_by_country.py）
+#   output/<国家>/<一级>/<一级>_<国家>.csv                     （merge_gmc_by_category_one.py）
+#   output/<国家>/<一级>/<二级>/<二级>_<国家>.csv              （merge_gmc_by_category_two_python.py）
+#   output/<国家>/<一级>/<二级>/<三级>/<三级>_<国家>.csv       （merge_gmc_by_category_three_python.py）
+# 原始导出文件只顺序读取一次，每条记录按原始字节同时写入国家文件和它所属的各级类目文件。
+# 压缩输出时句柄被淘汰后再追加会产生多个 gzip member / zstd frame，所以第一遍只写国家文件，
+# 之后逐个国家把国家文件按原始类目分组一次，每个类目文件取其子树的记录一次写完（gmc_shared.split_levels）。
+# 各国家目录下的 .category_manifest.json 记录每个类目文件的路径和行数。
+
+import csv
+import time
+import argparse
+from pathlib import Path
+
+from gmc_io import (OutputPool, DEFAULT_MAX_OPEN, DEFAULT_BUFFER_SIZE, iter_raw_records, read_header_line,
+                    is_csv, csv_name, open_input, open_output, add_compression_args)
+from gmc_schema import CANONICAL_HEADER, CANONICAL_HEADER_LINE, normalize_record
+from gmc_dedup import FingerprintSet, record_fingerprint, DEFAULT_MEMORY_MB
+from gmc_columnar import write_parquet
+from gmc_taxonomy import Taxonomy
+from gmc_manifest import CategoryManifest
+from gmc_catindex import sort_country_file
+from gmc_shared import split_levels
+from gmc_titleindex import refresh_title_index
+
+def category_outputs(country_dir, country, chain, compress):
+    """某个类目路径对应的各级类目输出文件"""
+    return [country_dir.joinpath(*chain[:i + 1]) / csv_name(f'{chain[i]}_{country}', compress)
+            for i in range(len(chain))]
+
+def main():
+    parser = argparse.ArgumentParser(description='一次扫描生成国家文件及一/二/三级类目文件')
+    parser.add_argument('--levels', type=int, choices=[0, 1, 2, 3], default=3,
+                        help='同时生成到第几级类目文件，0 表示只生成国家文件，默认 3')
+    parser.add_argument('--sparse', action='store_true',
+                        help='只生成有数据的类目文件，不再为没有数据的类目写只有表头的文件')
+    parser.add_argument('--max-open-files', type=int, default=DEFAULT_MAX_OPEN,
+                        help=f'同时保持打开的输出文件数上限，默认 {DEFAULT_MAX_OPEN}')
+    parser.add_argument('--buffer-size', type=int, default=DEFAULT_BUFFER_SIZE,
+                        help=f'每个输出文件的写缓冲字节数，默认 {DEFAULT_BUFFER_SIZE}')
+    parser.add_argument('--no-dedup', dest='dedup', action='store_false',
+                        help='不去除重复行（国家、类目、排名、时间戳、标题都相同的行默认只保留第一条）')
+    parser.add_argument('--dedup-memory', type=int, default=DEFAULT_MEMORY_MB,
+                        help=f'去重指纹集合的内存预算（MB），超出后溢写到临时目录，默认 {DEFAULT_MEMORY_MB}')
+    parser.add_argument('--parquet', action='store_true',
+                        help='同时为每个国家生成带类型、字典编码的 <country>.parquet（需要 pyarrow）')
+    parser.add_argument('--sort-by-category', action='store_true',
+                        help='国家文件按类目和排名排序，并生成 .catidx.json 类目字节区间索引（仅未压缩输出）')
+    parser.add_argument('--title-index', action='store_true',
+                        help='为国家文件生成 product_title 倒排索引 <国家文件>.titleidx，'
+                             '供 merge_gmc_by_country_keyword.py 只读取命中的行（仅未压缩输出）')
+    add_compression_args(parser)
+    args = parser.parse_args()
+    if args.sort_by_category and args.compress:
+        parser.error('--sort-by-category 需要未压缩的国家文件，不能与 --compress 同时使用')
+    if args.title_index and args.compress:
+        parser.error('--title-index 需要未压缩的国家文件，不能与 --compress 同时使用')
+
+    print('--- 正在运行一次扫描分发版本 ---')
+
+    dir_path = Path(__file__).parent.parent / 'gmc_data'
+    output_dir = dir_path / 'output'
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    taxonomy = Taxonomy.load()
+
+    files = sorted(f for f in dir_path.iterdir() if f.is_file() and is_csv(f))
+    if not files:
+        print('没有找到需要处理的 .csv 文件。')
+        return
+    print(f'待处理文件总数: {len(files)}，类目层级: {args.levels}')
+
+    start_time = time.time()
+    pool = OutputPool(CANONICAL_HEADER_LINE, args.max_open_files, args.buffer_size, args.compress_level)
+    seen = FingerprintSet(args.dedup_memory, spill_dir=dir_path / '.dedup_tmp') if args.dedup else None
+    # 未压缩输出时第一遍就写类目文件；压缩输出时第一遍只写国家文件
+    stream = args.levels and not args.compress
+    # (国家, 类目) -> 该记录要写入的全部输出文件，第一项为国家文件
+    routes = {}
+    route_counts = {}
+    # 类目输出文件 -> (层级, 类目)
+    labels = {}
+    country_counts = {}
+    dedup_counts = {}
+
+    def route(country, category):
+        key = (country, category)
+        paths = routes.get(key)
+        if paths is None:
+            name = country.decode('utf-8')
+            country_dir = output_dir / name
+            paths = [country_dir / csv_name(name, args.compress)]
+            chain = taxonomy.route(category.decode('utf-8'), args.levels) if stream else ()
+            outputs = category_outputs(country_dir, name, chain, args.compress)
+            for level, (code, path) in enumerate(zip(chain, outputs), 1):
+                labels[path] = (level, code)
+            paths.extend(outputs)
+            # 本次运行第一次用到的文件先删除旧内容，OutputPool 之后以追加方式写入
+            for path in paths:
+                if path not in pool.paths:
+                    path.unlink(missing_ok=True)
+            routes[key] = paths
+        return paths
+
+    try:
+        for file in files:
+            print(f"正在处理: {file.name}")
+            try:
+                file_header = next(csv.reader([read_header_line(file).decode('utf-8')]), [])
+                if not file_header:
+                    continue
+                columns = (file_header.index('ranking_country'), file_header.index('ranking_category'))
+                canonical = file_header == CANONICAL_HEADER
+                row_count = 0
+                with open_input(file) as f:
+                    f.readline()
+                    for (country, category), record in iter_raw_records(f, columns):
+                        if not country:
+                            continue
+                        if not canonical:
+                            record = normalize_record(record, file_header)
+                        elif not record.endswith(b'\n'):
+                            record += b'\n'
+                        row_count += 1
+                        if seen is not None and not seen.add(record_fingerprint(record)):
+                            dedup_counts[country] = dedup_counts.get(country, 0) + 1
+                            continue
+                        key = (country, category.strip())
+                        for path in route(*key):
+                            pool.write(path, record)
+                        route_counts[key] = route_counts.get(key, 0) + 1
+                        country_counts[country] = country_counts.get(country, 0) + 1
+                print(f"文件 {file.name} 处理完成，共 {row_count} 行")
+            except Exception as e:
+                print(f"处理文件失败: {file}, 错误: {e}")
+                continue
+    finally:
+        pool.close()
+        if seen is not None:
+            seen.close()
+
+    # 有数据的类目文件 -> (层级, 类目, 行数)：流式写出时由各路由的行数汇总
+    country_results = {country: {} for country in country_counts}
+    for key, count in route_counts.items():
+        results = country_results[key[0]]
+        for path in routes[key][1:]:
+            level, code = labels[path]
+            results[path] = (level, code, results.get(path, (0, 0, 0))[2] + count)
+
+    # 逐个国家写入类目清单（压缩输出时先重读国家文件拆分类目文件）；没有数据的类目与逐级拆分脚本一致
+    # 生成只有表头的文件，稀疏模式下不生成，并删除以前运行留下的同名文件
+    written = 0
+    empty = 0
+    manifests = {}
+    chains = {taxonomy.route(code, args.levels) for code in taxonomy.order} if args.levels else set()
+    for country, results in country_results.items():
+        name = country.decode('utf-8')
+        country_dir = output_dir / name
+        manifest = manifests[country] = CategoryManifest.load(country_dir)
+        for level in range(1, args.levels + 1):
+            manifest.reset(level)
+        if not args.levels:
+            continue
+        if not stream:
+            results = split_levels(country_dir / csv_name(name, args.compress), country_dir, taxonomy, 1,
+                                   args.levels, args.compress, args.compress_level)
+        for path, (level, code, count) in results.items():
+            manifest.record(level, code, path, count)
+        written += len(results)
+        for chain in chains:
+            path = category_outputs(country_dir, name, chain, args.compress)[-1]
+            if path in results:
+                continue
+            if args.sparse:
+                path.unlink(missing_ok=True)
+                continue
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open_output(path, 'wb', args.compress_level) as out:
+                out.write(CANONICAL_HEADER_LINE)
+            manifest.record(len(chain), chain[-1], path, 0)
+            empty += 1
+    for manifest in manifests.values():
+        manifest.save()
+
+    for country, count in sorted(country_counts.items()):
+        name = country.decode('utf-8')
+        print(f"已生成: {output_dir / name / csv_name(name, args.compress)} ({count} 条)")
+    if dedup_counts:
+        removed = {country.decode('utf-8'): count for country, count in dedup_counts.items()}
+        print(f"去除重复行: 共 {sum(removed.values())} 条，{removed}")
+
+    if args.sort_by_category:
+        for country in country_counts:
+            name = country.decode('utf-8')
+            print(f"已生成: {sort_country_file(output_dir / name / csv_name(name, args.compress), taxonomy)}")
+
+    # 排序会改写国家文件，标题索引在排序之后生成；没有指定 --title-index 时也重建已有的索引
+    for country in country_counts:
+        name = country.decode('utf-8')
+        path = refresh_title_index(output_dir / name / csv_name(name, args.compress), args.title_index)
+        if path:
+            print(f"已生成: {path}")
+
+    if args.parquet:
+        for country in country_counts:
+            name = country.decode('utf-8')
+            path = write_parquet(output_dir / name / csv_name(name, args.compress))
+            if path:
+                print(f"已生成: {path}")
+
+    duration = round(time.time() - start_time, 2)
+    print(f'全部文件已生成：{len(country_counts)} 个国家文件，{written} 个有数据的类目文件，{empty} 个空类目文件。'
+          f'输出文件打开次数: {pool.opens}，总用时: {duration} 秒')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+按字节偏移读取记录的回归测试：国家文件中间有空行时，记录的偏移不能错位
+
+运行：python -m pytest scripts/test_gmc_offsets.py（或 python scripts/test_gmc_offsets.py）
+"""
+
+import csv
+import tempfile
+from pathlib import Path
+
+from gmc_io import iter_record_spans
+from gmc_catindex import sort_country_file, load_category_index, subtree_ranges
+from gmc_shared import split_levels
+from gmc_titleindex import build_title_index, iter_indexed_records, iter_fuzzy_records, normalize_title
+from gmc_taxonomy import Taxonomy
+
+HEADER = b'rank,ranking_country,ranking_category,product_title\n'
+RECORDS = [
+    b'1,US,2,Wireless Earbuds\n',
+    b'2,US,3,"Phone Case, ""Clear""\nSlim"\n',
+    b'3,US,2,USB Cable\r\n',
+    b'4,US,3,Screen Protector\n',
+    b'5,US,2,Charger',
+]
+# 第二条之后有一个空行，第三条之后有一个 \r\n 空行，最后一条没有换行
+DATA = HEADER + RECORDS[0] + RECORDS[1] + b'\n' + RECORDS[2] + b'\r\n' + RECORDS[3] + RECORDS[4]
+
+def _taxonomy():
+    return Taxonomy([{'code': 1, 'children': [{'code': 2}, {'code': 3}]}])
+
+def _write_country(tmp):
+    country_dir = Path(tmp) / 'US'
+    country_dir.mkdir()
+    path = country_dir / 'US.csv'
+    path.write_bytes(DATA)
+    return path
+
+def _rows(path):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return list(csv.reader(f))
+
+def test_record_spans_count_blank_lines():
+    lines = DATA[len(HEADER):].splitlines(keepends=True)
+    spans = list(iter_record_spans(lines, 2, len(HEADER)))
+    assert [record for _, record, _ in spans] == RECORDS
+    for _, record, start in spans:
+        assert DATA[start:start + len(record)] == record
+
+def test_split_levels_with_blank_lines():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _write_country(tmp)
+        results = split_levels(path, path.parent, _taxonomy(), 1, 2)
+        expected = _rows(path)
+        for out_path, (_, code, count) in results.items():
+            rows = _rows(out_path)
+            assert rows[0] == expected[0]
+            wanted = [row for row in expected[1:] if row and (code == '1' or row[2] == code)]
+            assert rows[1:] == wanted and count == len(wanted)
+        assert sorted(code for _, code, _ in results.values()) == ['1', '2', '3']
+
+def test_sort_country_file_with_blank_lines():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _write_country(tmp)
+        taxonomy = _taxonomy()
+        expected = [row for row in _rows(path)[1:] if row]
+        sort_country_file(path, taxonomy)
+        rows = _rows(path)
+        assert rows[1:] == sorted(expected, key=lambda row: (row[2], int(row[0])))
+        index = load_category_index(path, taxonomy)
+        data = path.read_bytes()
+        for code in ['1', '2', '3']:
+            spans, count = subtree_ranges(index, taxonomy, code)
+            got = list(csv.reader(b''.join(data[start:end] for start, end in spans).decode('utf-8').splitlines(True)))
+            assert got == [row for row in rows[1:] if code == '1' or row[2] == code] and count == len(got)
+
+def test_title_index_with_blank_lines():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _write_country(tmp)
+        build_title_index(path)
+        for keyword, expected in [('cable', [RECORDS[2]]), ('slim', [RECORDS[1]]), ('charger', [RECORDS[4]]),
+                                  ('s', [RECORDS[0], RECORDS[1], RECORDS[2], RECORDS[3]])]:
+            assert [record for _, record in iter_indexed_records(path, 3, keyword)] == expected
+        fuzzy = [record for _, record in iter_fuzzy_records(path, 3, normalize_title('screen protectr'))]
+        assert fuzzy == [RECORDS[3]]
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(f'{name} ok')